@@ -7,9 +7,11 @@ import subprocess
 from pathlib import Path
 from dotenv import load_dotenv
 from tafrigh import Config, TranscriptType, farrigh
+from tafrigh.writer import Writer
 import anthropic
 import gradio as gr
 import asyncio
+from whisper_service import WhisperService
 
 
 # Load environment variables from .env file
@@ -24,8 +26,11 @@ LANGUAGE_API_KEYS = {
     # Add more languages and API keys as needed
 }
 
+# 'wit' sends the audio to Wit.ai, 'whisper' transcribes it locally with the faster-whisper model kept in memory
+TRANSCRIBE_BACKEND = os.getenv('TRANSCRIBE_BACKEND', 'wit')
+
 # Check if at least one API key is provided
-if not any(LANGUAGE_API_KEYS.values()):
+if TRANSCRIBE_BACKEND == 'wit' and not any(LANGUAGE_API_KEYS.values()):
     print("Error: At least one Wit.ai API key must be provided in the .env file.")
     sys.exit()
 
@@ -39,6 +44,9 @@ anthropic_client = anthropic.Anthropic(
     api_key=ANTHROPIC_API_KEY,
 )
 
+# Loaded once when the app starts and shared by all the jobs, instead of once per farrigh call
+whisper_service = WhisperService()
+
 # Create queues for each function
 #download_queue = queue()
 #extract_queue = queue()
@@ -100,6 +108,24 @@ def is_wav_file(file_path):
     except IOError:
         return False
 
+def transcription_output(file_path):
+    return Config.Output(
+        min_words_per_segment=1,
+        save_files_before_compact=False,
+        save_yt_dlp_responses=False,
+        output_sample=0,
+        output_formats=[TranscriptType.TXT, TranscriptType.SRT],
+        output_dir=os.path.join(str(file_path.parent)),
+    )
+
+# Same SRT and TXT files as farrigh writes, from the resident model
+def transcribe_file_whisper(file_path, language_sign, progress=gr.Progress()):
+    segments = whisper_service.transcribe(file_path, language_sign.lower(),
+                                          on_progress=lambda fraction: progress(0.2 + 0.5 * fraction, "Transcribing audio file..."))
+    output = transcription_output(file_path)
+    Writer().write_all(file_path.stem, segments, output)
+    return Path(output.output_dir) / f"{file_path.stem}.srt"
+
 #@transcribe_queue.task
 def transcribe_file(file_path, language_sign,progress=gr.Progress()):
     progress(0.2, "Transcribing audio file...")
@@ -107,6 +133,12 @@ def transcribe_file(file_path, language_sign,progress=gr.Progress()):
         print(f"Skipping file {file_path} as it is not in WAV format.")
         return None
 
+    if TRANSCRIBE_BACKEND == 'whisper':
+        srt_file = transcribe_file_whisper(file_path, language_sign, progress)
+        progress(0.7)
+        print(f"Whisper: {whisper_service.stats()}")
+        return srt_file if srt_file.exists() and srt_file.stat().st_size > 0 else None
+
     wit_api_key = LANGUAGE_API_KEYS.get(language_sign.upper())
     if not wit_api_key:
         print(f"API key not found for language: {language_sign}")
@@ -255,7 +287,7 @@ def interface(source_type, youtube_url, file_path, language_sign, target_languag
 inputs = [
     gr.Radio(choices=["YouTube video", "Local file"], label="Choose the source type:"),
     gr.Textbox(label="Enter the YouTube video link:", placeholder="YouTube URL"),
-    gr.File(label="Upload a local file:", file_types=['wav', 'mp3', 'mp4', 'mkv', 'avi']),
+    gr.File(label="Upload a local file:", file_types=['.wav', '.mp3', '.mp4', '.mkv', '.avi']),
     gr.Dropdown(choices=list(LANGUAGE_API_KEYS.keys()), label="Select the language:"),
     gr.Dropdown(choices=['', 'en', 'ar', 'fr', 'ja', 'es', 'de', 'Darija'], label="Select the target language for translation (Optional):")
 ]
@@ -268,5 +300,7 @@ demo = gr.Interface(fn=interface, concurrency_limit=4,inputs=inputs, outputs=out
 # https://youtu.be/zy8F_tGJYBM?si=65RDzq4JTbm-kzq9
 # https://youtu.be/zy8F_tGJYBM?si=65RDzq4JTbm-kzq9
 if __name__ == '__main__':
+    if TRANSCRIBE_BACKEND == 'whisper':
+        whisper_service.load()
     demo.queue()
     demo.launch()
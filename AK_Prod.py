@@ -7,26 +7,57 @@ import subprocess
 from pathlib import Path
 from dotenv import load_dotenv
 from tafrigh import Config, TranscriptType, farrigh
+from tafrigh.writer import Writer
 import anthropic
+from translation_memory import TranslationMemory, normalize_cue_text
+from token_budget import TokenBudget
+from revision_gate import RevisionGate, context_cues, load_wordlist
+from artifact_cache import ArtifactStore, Incomplete, hash_file, run_cached_stage, youtube_video_id
+from rate_limit import RateLimitScheduler
+from job_engine import JobEngine, StageFailed
+from job_client import JobClient
+from vad import detect_speech, to_original_time, write_speech_shard
+from whisper_service import WhisperService, whisper_installed
+from transcription_router import TranscriptionRouter
+import metrics
+from subtitles import Cue, format_cue, read_srt, remember, slice_cues, word_count, write_srt
 import gradio as gr
 import asyncio
 import uuid
+import time
+import math
+import csv
+import bisect
+import hashlib
+import shutil
+import wave
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import Counter
 
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Each variable can hold a comma separated pool of Wit.ai tokens for the same language
+def wit_token_pool(env_name):
+    return [token.strip() for token in (os.getenv(env_name) or '').split(',') if token.strip()]
+
 # Define Wit.ai API keys for languages using environment variables
 LANGUAGE_API_KEYS = {
-    'AR': os.getenv('WIT_API_KEY_ARABIC'),
-    'EN': os.getenv('WIT_API_KEY_ENGLISH'),
-    'FR': os.getenv('WIT_API_KEY_FRENCH'),
-    'JA': os.getenv('WIT_API_KEY_JAPANESE'),
+    'AR': wit_token_pool('WIT_API_KEY_ARABIC'),
+    'EN': wit_token_pool('WIT_API_KEY_ENGLISH'),
+    'FR': wit_token_pool('WIT_API_KEY_FRENCH'),
+    'JA': wit_token_pool('WIT_API_KEY_JAPANESE'),
     # Add more languages and API keys as needed
 }
 
+# Where the shards are transcribed, see transcription_router.py: 'auto' (Wit.ai, spilling to the local whisper model
+# under load or for languages without a token), 'wit' or 'whisper'
+TRANSCRIBE_BACKEND = os.getenv('TRANSCRIBE_BACKEND', 'auto')
+
 # Check if at least one API key is provided
-if not any(LANGUAGE_API_KEYS.values()):
+if not any(LANGUAGE_API_KEYS.values()) and not (TRANSCRIBE_BACKEND != 'wit' and whisper_installed()):
     print("Error: At least one Wit.ai API key must be provided in the .env file.")
     sys.exit()
 
@@ -36,9 +67,148 @@ if not ANTHROPIC_API_KEY:
     print("Error: Anthropic API key must be provided in the .env file.")
     sys.exit()
 
+# Retries are left to the scheduler below, so a throttled call waits in line instead of being retried blindly
 anthropic_client = anthropic.Anthropic(
     api_key=ANTHROPIC_API_KEY,
+    max_retries=0,
+)
+
+# One limiter per Wit.ai token and one for Anthropic, shared by every job of the process
+scheduler = RateLimitScheduler()
+scheduler.configure(
+    'wit:',
+    requests_per_minute=int(os.getenv('WIT_REQUESTS_PER_MINUTE', '60')),
+    burst=int(os.getenv('WIT_BURST', '60')),
+    max_concurrency=1,
+)
+scheduler.configure(
+    'anthropic',
+    requests_per_minute=int(os.getenv('ANTHROPIC_REQUESTS_PER_MINUTE', '50')),
+    burst=int(os.getenv('ANTHROPIC_BURST', '10')),
+    max_concurrency=int(os.getenv('ANTHROPIC_MAX_CONCURRENCY', '8')),
+)
+
+whisper_service = WhisperService()
+transcription_router = TranscriptionRouter(scheduler, whisper_service, TRANSCRIBE_BACKEND)
+
+def wit_key(wit_api_key):
+    return 'wit:' + hashlib.sha256(wit_api_key.encode('utf-8')).hexdigest()[:12]
+
+# Rate limits (429), overloads (529 / 5xx) and dropped connections go back into the scheduler queue
+def anthropic_throttle_info(error):
+    if not isinstance(error, (anthropic.RateLimitError, anthropic.InternalServerError, anthropic.APIConnectionError)):
+        return None
+    response = getattr(error, 'response', None)
+    retry_after = response.headers.get('retry-after') if response is not None else None
+    try:
+        return float(retry_after) if retry_after else 0
+    except ValueError:
+        return 0
+
+CLAUDE_MODEL = "claude-3-haiku-20240307"
+CLAUDE_MAX_OUTPUT_TOKENS = 4096
+
+# Subtitles are translated in batches of cues so long videos are not truncated by max_tokens
+# and one slow call does not block the whole job. A batch is closed at TRANSLATION_BATCH_SIZE cues or once its
+# estimated output reaches BATCH_OUTPUT_FILL of the output limit, whichever comes first.
+TRANSLATION_BATCH_SIZE = int(os.getenv('TRANSLATION_BATCH_SIZE', '40'))
+TRANSLATION_MAX_WORKERS = int(os.getenv('TRANSLATION_MAX_WORKERS', '4'))
+BATCH_OUTPUT_FILL = 0.75
+
+translation_memory = TranslationMemory(
+    os.getenv('TRANSLATION_MEMORY_PATH', 'translation_memory.sqlite3'),
+    max_entries=int(os.getenv('TRANSLATION_MEMORY_MAX_ENTRIES', '200000')),
+)
+token_budget = TokenBudget(os.getenv('TRANSLATION_MEMORY_PATH', 'translation_memory.sqlite3'))
+
+artifact_store = ArtifactStore(
+    os.getenv('ARTIFACT_CACHE_DIR', 'artifacts'),
+    max_bytes=int(os.getenv('ARTIFACT_CACHE_MAX_BYTES', str(20 * 1024 ** 3))),
+)
+
+# Everything below is part of the artifact cache keys, changing it invalidates the cached stages that depend on it
+YT_DLP_FORMAT = 'bestvideo[height<=480][ext=mp4]+bestaudio[ext=m4a]/mp4'
+# YouTube jobs fetch the audio on its own, piped straight into ffmpeg, and start transcribing the first shards
+# while the video is still downloading
+STREAM_YOUTUBE_AUDIO = os.getenv('STREAM_YOUTUBE_AUDIO', '1') == '1'
+YOUTUBE_AUDIO_FORMAT = 'bestaudio[ext=m4a]/bestaudio/best'
+# 'transcribe' writes what the Wit.ai recognizer consumes (16 kHz mono) so the audio is not converted twice,
+# 'legacy' is the previous 44.1 kHz stereo output
+AUDIO_PROFILES = {
+    'transcribe': ['-vn', '-acodec', 'pcm_s16le', '-ar', '16000', '-ac', '1'],
+    'legacy': ['-vn', '-acodec', 'pcm_s16le', '-ar', '44100', '-ac', '2'],
+}
+EXTRACT_AUDIO_ARGS = AUDIO_PROFILES[os.getenv('AUDIO_PROFILE', 'transcribe')]
+# The extracted audio is kept in the artifact cache in this format and decoded back to WAV when reused
+AUDIO_ARTIFACT_FORMATS = {
+    'wav': None,
+    'flac': ('.flac', ['-c:a', 'flac']),
+    'opus': ('.opus', ['-c:a', 'libopus', '-b:a', '32k']),
+}
+AUDIO_ARTIFACT_FORMAT = os.getenv('AUDIO_ARTIFACT_FORMAT', 'flac')
+TRANSCRIBE_SETTINGS = dict(
+    model_name_or_path="medium",
+    task="",
+    language="",
+    use_faster_whisper=False,
+    beam_size=7,
+    ct2_compute_type="",
+    max_cutting_duration=5,
+    min_words_per_segment=1,
+)
+# 'soft' muxes the subtitles as a track without re-encoding, 'burn' draws them into the frames for platforms that need hard subs,
+# 'smart' burns them in but only re-encodes the parts of the video that have subtitles.
+# The Gradio and Streamlit players do not show a mov_text track, so 'soft' is only for videos downloaded to a desktop player
+SUBTITLE_MODES = ('soft', 'burn', 'smart')
+SUBTITLE_MODE = os.getenv('SUBTITLE_MODE', 'burn')
+SUBTITLE_LANGUAGE_CODES = {
+    'EN': 'eng',
+    'AR': 'ara',
+    'FR': 'fra',
+    'JA': 'jpn',
+    'ES': 'spa',
+    'DE': 'deu',
+    'DARIJA': 'ary',
+}
+# Burn-in splits the video at keyframes and encodes the segments in parallel, segments shorter than this are not worth a process
+BURN_IN_WORKERS = int(os.getenv('BURN_IN_WORKERS', str(os.cpu_count() or 1)))
+MIN_BURN_IN_SEGMENT_SECONDS = 10
+# The audio is transcribed in shards of this length, one shard per Wit.ai token at a time
+TRANSCRIBE_SHARD_SECONDS = int(os.getenv('TRANSCRIBE_SHARD_SECONDS', '300'))
+# Silence is cut out of every shard before it goes to Wit.ai (see vad.py), VAD_ENABLED=0 sends the shards as they are
+VAD_ENABLED = os.getenv('VAD_ENABLED', '1') == '1'
+VAD_SETTINGS = dict(
+    frame_seconds=0.03,
+    margin_db=float(os.getenv('VAD_MARGIN_DB', '12')),
+    floor_db=-50.0,
+    min_speech_seconds=0.25,
+    min_silence_seconds=0.6,
+    padding_seconds=0.2,
+)
+TRANSLATE_INSTRUCTION = ("Translate the text of each numbered subtitle cue below to the target following language or dialect {target_language}. "
+                         "Keep every '#<number>' line exactly as it is and write the translation of that cue under it.")
+TRANSLATE_SYSTEM = "Return only the numbered cues, each '#<number>' line followed by its translation."
+REVISE_INSTRUCTION = ("FIX WRONG SPELLED WORDS / CONSISTENCY OF THE DIALOGUES OF THE FOLLOWING NUMBERED SUBTITLE CUES. "
+                      "Keep every '#<number>' line exactly as it is and write the fixed text of that cue under it.")
+REVISE_SYSTEM = "Return only the numbered cues, each '#<number>' line followed by its fixed text."
+# Both results of a cue in one block: the fixed text, a line with only the separator, then the translation of the fixed text
+REVISED_TRANSLATION_SEPARATOR = '=>'
+REVISE_TRANSLATE_INSTRUCTION = (
+    "For each numbered subtitle cue below, FIX WRONG SPELLED WORDS / CONSISTENCY OF THE DIALOGUES, then translate the fixed text "
+    "to the target following language or dialect {target_language}. Keep every '#<number>' line exactly as it is and write under it "
+    "the fixed text, a line with only '" + REVISED_TRANSLATION_SEPARATOR + "', then the translation."
 )
+REVISE_TRANSLATE_SYSTEM = ("Return only the numbered cues, each '#<number>' line followed by its fixed text, a '"
+                           + REVISED_TRANSLATION_SEPARATOR + "' line and its translation.")
+# Jobs fix the spelling of the transcription before translating it, in the same Claude request when there is a translation
+REVISE_SUBTITLES = os.getenv('REVISE_SUBTITLES', '0') == '1'
+# A revision on its own only sends the cues flagged by the local checks (revision_gate.py), with the cues around them
+REVISE_ONLY_FLAGGED = os.getenv('REVISE_ONLY_FLAGGED', '1') == '1'
+REVISION_CONTEXT_CUES = int(os.getenv('REVISION_CONTEXT_CUES', '1'))
+# One word per line, e.g. /usr/share/dict/words or a list of the Darija spellings in use
+REVISION_WORDLIST = os.getenv('REVISION_WORDLIST')
+REVISION_CONTEXT_HEADER = "Neighbouring cues, for context only, do not return them:"
+revision_gate = RevisionGate(load_wordlist(REVISION_WORDLIST) if REVISION_WORDLIST else None)
 
 # Create queues for each function
 #download_queue = queue()
@@ -48,31 +218,72 @@ anthropic_client = anthropic.Anthropic(
 #merge_queue = queue()
 
 #@download_queue.task
-def download_youtube_video(youtube_url, progress=gr.Progress()):
+@metrics.traced('download')
+def download_youtube_video(youtube_url, progress=gr.Progress(), unique_id=None):
     progress(0, "Downloading YouTube video...")
-    unique_id = uuid.uuid4()  # Generate a random UUID
+    unique_id = unique_id or uuid.uuid4()  # Generate a random UUID
     output_path = Path('downloads') / f'{unique_id}.%(ext)s'  # Use the UUID as part of the file name
-    command = ['yt-dlp', '-f', 'bestvideo[height<=480][ext=mp4]+bestaudio[ext=m4a]/mp4', '-o', str(output_path), youtube_url]
-    subprocess.run(command, check=True)
+    command = ['yt-dlp', '-f', YT_DLP_FORMAT, '-o', str(output_path), youtube_url]
+    metrics.run(command, check=True)
     video_file = next(Path('downloads').glob(f'{unique_id}.mp4'))
 
     progress(0.1)
     return video_file
 
 #@extract_queue.task
-def extract_audio(file_path, progress=gr.Progress()):
+@metrics.traced('extract_audio')
+def extract_audio(file_path, progress=gr.Progress(), args=EXTRACT_AUDIO_ARGS):
     progress(0.1, "Extracting audio from video...")
     audio_output_path = file_path.with_suffix('.wav')
-    command = ['ffmpeg', '-i', str(file_path), '-vn', '-acodec', 'pcm_s16le', '-ar', '44100', '-ac', '2', str(audio_output_path)]
-    subprocess.run(command, check=True)
+    command = ['ffmpeg', '-i', str(file_path), *args, str(audio_output_path)]
+    metrics.run(command, check=True)
 
     progress(0.2)
     return audio_output_path
 
-#@merge_queue.task
-def merge_subtitles(video_path, srt_path, language, progress=gr.Progress()):
-    progress(0.9, "Merging subtitles with video...")
-    output_path = video_path.with_name(video_path.stem + '_with_subs.mp4')
+def compress_audio(audio_path, artifact_format=AUDIO_ARTIFACT_FORMAT):
+    suffix, codec_args = AUDIO_ARTIFACT_FORMATS[artifact_format]
+    compact_path = audio_path.with_suffix(suffix)
+    command = ['ffmpeg', '-y', '-loglevel', 'error', '-i', str(audio_path), *codec_args, str(compact_path)]
+    metrics.run(command, check=True)
+    return compact_path
+
+def decompress_audio(compact_path, audio_path, args=EXTRACT_AUDIO_ARGS):
+    command = ['ffmpeg', '-y', '-loglevel', 'error', '-i', str(compact_path), *args, str(audio_path)]
+    metrics.run(command, check=True)
+    return audio_path
+
+# Extract stage through the artifact cache, the cached copy is stored compressed (AUDIO_ARTIFACT_FORMAT)
+def cached_extract_audio(source_key, video_file, progress=gr.Progress()):
+    audio_path = video_file.with_suffix('.wav')
+    if not AUDIO_ARTIFACT_FORMATS[AUDIO_ARTIFACT_FORMAT]:
+        return run_cached_stage(
+            artifact_store, 'extract_audio', source_key, {'args': EXTRACT_AUDIO_ARGS},
+            audio_path,
+            lambda: extract_audio(video_file, progress),
+        )
+
+    suffix, _ = AUDIO_ARTIFACT_FORMATS[AUDIO_ARTIFACT_FORMAT]
+    compact_path, audio_key = run_cached_stage(
+        artifact_store, 'extract_audio', source_key, {'args': EXTRACT_AUDIO_ARGS, 'format': AUDIO_ARTIFACT_FORMAT},
+        audio_path.with_suffix(suffix),
+        lambda: compress_audio(extract_audio(video_file, progress)),
+    )
+    if compact_path is None:
+        return None, audio_key
+    if not audio_path.exists():
+        decompress_audio(compact_path, audio_path)
+    return audio_path, audio_key
+
+def mux_subtitles(video_path, srt_path, language, output_path):
+    language_code = SUBTITLE_LANGUAGE_CODES.get(language.upper(), 'und')
+    command = ['ffmpeg', '-y', '-i', str(video_path), '-sub_charenc', 'UTF-8', '-i', str(srt_path),
+               '-map', '0:v', '-map', '0:a?', '-map', '1:0', '-c', 'copy', '-c:s', 'mov_text',
+               '-metadata:s:s:0', f'language={language_code}', '-disposition:s:0', 'default', str(output_path)]
+    metrics.run(command, check=True)
+    return output_path
+
+def subtitles_filter_for(srt_path, language):
     srt_path_str = str(srt_path.resolve()).replace('\\', '\\\\').replace(':', '\\:')
 
     font_size = 24
@@ -85,13 +296,189 @@ def merge_subtitles(video_path, srt_path, language, progress=gr.Progress()):
         # Add more language-font mappings as needed
     }
 
-    if language in language_fonts:
-        font_name, font_size = language_fonts[language]
-    
-    subtitles_filter = f"subtitles='{srt_path_str}':charenc=UTF-8:force_style='FontName={font_name},FontSize={font_size}'"
+    # The target languages of a translation are lower case ('ar', 'ja')
+    if language.upper() in language_fonts:
+        font_name, font_size = language_fonts[language.upper()]
+
+    return f"subtitles='{srt_path_str}':charenc=UTF-8:force_style='FontName={font_name},FontSize={font_size}'"
+
+def burn_subtitles(video_path, srt_path, language, output_path):
+    subtitles_filter = subtitles_filter_for(srt_path, language)
     command = ['ffmpeg', '-hwaccel', 'auto', '-i', str(video_path), '-vf', subtitles_filter, '-c:v', 'libx264', '-preset', 'ultrafast', '-c:a', 'copy', str(output_path)]
-    subprocess.run(command, check=True)
-    
+    metrics.run(command, check=True)
+    return output_path
+
+def probe_duration(media_path):
+    command = ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'csv=p=0', str(media_path)]
+    result = metrics.run(command, check=True, capture_output=True, text=True)
+    return float(result.stdout.strip())
+
+def probe_video_stream(video_path):
+    command = ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'stream=codec_name,pix_fmt,time_base',
+               '-of', 'default=noprint_wrappers=1', str(video_path)]
+    result = metrics.run(command, check=True, capture_output=True, text=True)
+    return dict(line.split('=', 1) for line in result.stdout.splitlines() if '=' in line)
+
+def video_keyframes(video_path):
+    command = ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0', str(video_path)]
+    result = metrics.run(command, check=True, capture_output=True, text=True)
+    keyframes = []
+    for line in result.stdout.splitlines():
+        pts_time, _, flags = line.partition(',')
+        if 'K' in flags and pts_time not in ('', 'N/A'):
+            keyframes.append(float(pts_time))
+    return sorted(keyframes)
+
+# Stream copies the video track into segments starting at each of split_times (which must be keyframes),
+# returns (path, start, end) per segment. annexb keeps the SPS/PPS in band so copied and re-encoded segments can be mixed.
+def split_video_at_keyframes(video_path, split_times, segment_dir, annexb=False):
+    segment_list = segment_dir / 'segments.csv'
+    command = ['ffmpeg', '-y', '-i', str(video_path), '-map', '0:v:0', '-c', 'copy']
+    if annexb:
+        command += ['-bsf:v', 'h264_mp4toannexb']
+    # The segment muxer cuts on the first keyframe at or after each time, the margin absorbs the rounding of pts_time
+    command += ['-f', 'segment', '-reset_timestamps', '1', '-segment_list', str(segment_list), '-segment_list_type', 'csv']
+    if split_times:
+        command += ['-segment_times', ','.join(f'{max(0.0, t - 0.0005):.4f}' for t in split_times)]
+    else:
+        # A single segment, the muxer would otherwise cut every 2 seconds
+        command += ['-segment_time', str(10 ** 9)]
+    command += [str(segment_dir / 'segment_%04d.mp4')]
+    metrics.run(command, check=True)
+    with open(segment_list, 'r', encoding='utf-8', newline='') as infile:
+        names = [row[0] for row in csv.reader(infile)]
+    bounds = [0.0] + list(split_times) + [probe_duration(video_path)]
+    if len(names) != len(bounds) - 1:
+        raise RuntimeError(f"Expected {len(bounds) - 1} segments from {video_path}, got {len(names)}")
+    return [(segment_dir / name, bounds[i], bounds[i + 1]) for i, name in enumerate(names)]
+
+def concat_segments(segment_paths, video_path, output_path, segment_dir, extra_args=()):
+    concat_list = segment_dir / 'concat.txt'
+    with open(concat_list, 'w', encoding='utf-8') as outfile:
+        for segment_path in segment_paths:
+            escaped_path = str(segment_path.resolve()).replace("'", "'\\''")
+            outfile.write(f"file '{escaped_path}'\n")
+    command = ['ffmpeg', '-y', '-f', 'concat', '-safe', '0', '-i', str(concat_list), '-i', str(video_path),
+               '-map', '0:v', '-map', '1:a?', '-c', 'copy', *extra_args, str(output_path)]
+    metrics.run(command, check=True)
+    return output_path
+
+def burn_subtitles_parallel(video_path, srt_path, language, output_path, workers):
+    segment_dir = video_path.with_name(video_path.stem + '_segments')
+    segment_dir.mkdir(exist_ok=True)
+    try:
+        # The keyframes closest to an even split of the video
+        duration = probe_duration(video_path)
+        keyframes = video_keyframes(video_path)
+        split_times = sorted({min(keyframes, key=lambda k: abs(k - duration * i / workers)) for i in range(1, workers)} - {keyframes[0]})
+        segments = split_video_at_keyframes(video_path, split_times, segment_dir)
+        cues = read_srt(srt_path)
+        threads = max(1, (os.cpu_count() or 1) // workers)
+
+        def burn(segment):
+            segment_path, start, end = segment
+            burned_path = segment_path.with_name(segment_path.stem + '_burned.mp4')
+            segment_cues = slice_cues(cues, start, end)
+            command = ['ffmpeg', '-y', '-hwaccel', 'auto', '-i', str(segment_path)]
+            if segment_cues:
+                segment_srt = segment_path.with_suffix('.srt')
+                write_srt(segment_srt, segment_cues)
+                command += ['-vf', subtitles_filter_for(segment_srt, language)]
+            # Same encoder settings for every segment so they can be joined without re-encoding
+            command += ['-c:v', 'libx264', '-preset', 'ultrafast', '-threads', str(threads), str(burned_path)]
+            metrics.run(command, check=True)
+            return burned_path
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            burned_paths = list(executor.map(metrics.bind(burn), segments))
+        concat_segments(burned_paths, video_path, output_path, segment_dir)
+    finally:
+        shutil.rmtree(segment_dir, ignore_errors=True)
+    return output_path
+
+# Keyframe aligned [start, end) ranges of the video that have at least one cue on screen
+def subtitled_ranges(cues, keyframes, duration):
+    ranges = []
+    times = sorted((cue.start, cue.end) for cue in cues)
+    for cue_start, cue_end in times:
+        range_start = keyframes[max(0, bisect.bisect_right(keyframes, cue_start) - 1)]
+        next_keyframe = bisect.bisect_right(keyframes, cue_end)
+        range_end = keyframes[next_keyframe] if next_keyframe < len(keyframes) else duration
+        if ranges and range_start <= ranges[-1][1]:
+            ranges[-1][1] = max(ranges[-1][1], range_end)
+        else:
+            ranges.append([range_start, range_end])
+    return ranges
+
+# Re-encodes only the GOPs that carry subtitles and stream copies everything else, so the encoding cost follows
+# the subtitled duration. The re-encoded parts repeat their SPS/PPS and the output is tagged avc3, which allows
+# the parameter sets to change between the copied and the re-encoded parts.
+def smart_render_subtitles(video_path, srt_path, language, output_path, workers):
+    stream = probe_video_stream(video_path)
+    if stream.get('codec_name') != 'h264':
+        print(f"Smart render needs an H.264 source, got {stream.get('codec_name')}, burning in the whole video.")
+        return burn_subtitles_parallel(video_path, srt_path, language, output_path, workers) if workers > 1 else burn_subtitles(video_path, srt_path, language, output_path)
+
+    duration = probe_duration(video_path)
+    keyframes = video_keyframes(video_path)
+    cues = read_srt(srt_path)
+    ranges = subtitled_ranges(cues, keyframes, duration)
+    split_times = sorted({t for subtitled_range in ranges for t in subtitled_range if keyframes[0] < t < duration})
+
+    segment_dir = video_path.with_name(video_path.stem + '_segments')
+    segment_dir.mkdir(exist_ok=True)
+    try:
+        segments = split_video_at_keyframes(video_path, split_times, segment_dir, annexb=True)
+        timescale = stream.get('time_base', '1/90000').split('/')[-1]
+        threads = max(1, (os.cpu_count() or 1) // max(1, workers))
+
+        def render(segment):
+            segment_path, start, end = segment
+            segment_cues = slice_cues(cues, start, end)
+            if not segment_cues:
+                return segment_path
+            rendered_path = segment_path.with_name(segment_path.stem + '_burned.mp4')
+            segment_srt = segment_path.with_suffix('.srt')
+            write_srt(segment_srt, segment_cues)
+            command = ['ffmpeg', '-y', '-hwaccel', 'auto', '-i', str(segment_path), '-vf', subtitles_filter_for(segment_srt, language),
+                       '-c:v', 'libx264', '-preset', 'ultrafast', '-x264-params', 'repeat-headers=1',
+                       '-pix_fmt', stream.get('pix_fmt', 'yuv420p'), '-video_track_timescale', timescale,
+                       '-threads', str(threads), str(rendered_path)]
+            metrics.run(command, check=True)
+            return rendered_path
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            rendered_paths = list(executor.map(metrics.bind(render), segments))
+        concat_segments(rendered_paths, video_path, output_path, segment_dir, ['-tag:v', 'avc3'])
+    finally:
+        shutil.rmtree(segment_dir, ignore_errors=True)
+
+    rendered_seconds = sum(end - start for start, end in ranges)
+    print(f"Smart render re-encoded {rendered_seconds:.1f}s of {duration:.1f}s ({len(ranges)} ranges).")
+    return output_path
+
+#@merge_queue.task
+@metrics.traced('merge')
+def merge_subtitles(video_path, srt_path, language, progress=gr.Progress(), mode=SUBTITLE_MODE, workers=BURN_IN_WORKERS):
+    progress(0.9, "Merging subtitles with video...")
+    output_path = video_path.with_name(video_path.stem + '_with_subs.mp4')
+    if mode == 'soft':
+        # Stream copy, takes seconds whatever the length of the video
+        mux_subtitles(video_path, srt_path, language, output_path)
+        progress(1.0)
+        return output_path
+
+    if mode == 'smart':
+        smart_render_subtitles(video_path, srt_path, language, output_path, workers)
+        progress(1.0)
+        return output_path
+
+    workers = min(workers, int(probe_duration(video_path) // MIN_BURN_IN_SEGMENT_SECONDS)) if workers > 1 else 1
+    if workers > 1:
+        burn_subtitles_parallel(video_path, srt_path, language, output_path, workers)
+    else:
+        burn_subtitles(video_path, srt_path, language, output_path)
+
     progress(1.0)
     return output_path
 
@@ -102,44 +489,209 @@ def is_wav_file(file_path):
     except IOError:
         return False
 
-#@transcribe_queue.task
-def transcribe_file(file_path, language_sign,progress=gr.Progress()):
-    progress(0.2, "Transcribing audio file...")
-    if not is_wav_file(file_path):
-        print(f"Skipping file {file_path} as it is not in WAV format.")
-        return None
-
-    wit_api_key = LANGUAGE_API_KEYS.get(language_sign.upper())
-    if not wit_api_key:
-        print(f"API key not found for language: {language_sign}")
-        return None
+def split_wav_shards(wav_path, shard_seconds):
+    shard_dir = wav_path.with_name(wav_path.stem + '_shards')
+    shard_dir.mkdir(exist_ok=True)
+    shards = []
+    with wave.open(str(wav_path), 'rb') as wav:
+        params = wav.getparams()
+        frames_per_shard = int(params.framerate * shard_seconds)
+        position = 0
+        while position < params.nframes:
+            frames = wav.readframes(frames_per_shard)
+            if not frames:
+                break
+            shard_path = shard_dir / f'{wav_path.stem}_{len(shards):04d}.wav'
+            with wave.open(str(shard_path), 'wb') as shard:
+                shard.setparams(params)
+                shard.writeframes(frames)
+            shards.append((shard_path, position / params.framerate))
+            position += len(frames) // (params.sampwidth * params.nchannels)
+    return shards
 
+def transcribe_shard(shard_path, wit_api_keys):
     config = Config(
-        urls_or_paths=[str(file_path)],
+        urls_or_paths=[str(shard_path)],
         skip_if_output_exist=False,
         playlist_items="",
         verbose=False,
-        model_name_or_path="medium",
-        task="",
-        language="",
-        use_faster_whisper=False,
-        beam_size=7,
-        ct2_compute_type="",
-        wit_client_access_tokens=[wit_api_key],
-        max_cutting_duration=5,
-        min_words_per_segment=1,
+        wit_client_access_tokens=wit_api_keys,
         save_files_before_compact=False,
         save_yt_dlp_responses=False,
         output_sample=0,
-        output_formats=[TranscriptType.TXT, TranscriptType.SRT],
-        output_dir=os.path.join(str(file_path.parent)),
+        output_formats=[TranscriptType.SRT],
+        output_dir=str(shard_path.parent),
+        **TRANSCRIBE_SETTINGS,
     )
-
     farrigh_progress = list(farrigh(config))
+    shard_srt = shard_path.with_suffix('.srt')
+    return read_srt(shard_srt) if shard_srt.exists() else None
+
+# Same cues as a Wit.ai shard, from the resident whisper model
+def transcribe_whisper_shard(shard_path, language_sign):
+    segments = whisper_service.transcribe(shard_path, language_sign.lower())
+    segments = Writer().compact_segments(segments, TRANSCRIBE_SETTINGS['min_words_per_segment'])
+    return [Cue(index, segment['start'], segment['end'], segment['text']) for index, segment in enumerate(segments, 1)]
+
+def wav_duration(wav_path):
+    with wave.open(str(wav_path), 'rb') as wav:
+        return wav.getnframes() / wav.getframerate()
+
+def wit_call_estimate(seconds):
+    # tafrigh makes about one Wit.ai call per max_cutting_duration seconds of audio
+    return max(1, math.ceil(seconds / TRANSCRIBE_SETTINGS['max_cutting_duration']))
+
+# Replaces every (shard_path, offset) with a shard holding only its speech regions and a function mapping the times of
+# that shard back to the original audio. Shards without any speech are dropped, savings counts the Wit.ai calls avoided.
+def speech_only_shards(shards, savings):
+    for shard_path, offset in shards:
+        duration = wav_duration(shard_path)
+        savings['audio_seconds'] += duration
+        savings['calls_before'] += wit_call_estimate(duration)
+        regions = detect_speech(shard_path, **VAD_SETTINGS)
+        if regions is None:
+            # Not 16 bit PCM, sent as it is
+            savings['speech_seconds'] += duration
+            savings['calls_after'] += wit_call_estimate(duration)
+            yield shard_path, offset
+            continue
+        if not regions:
+            continue
+        speech_path = shard_path.with_name(shard_path.stem + '_speech.wav')
+        segments = write_speech_shard(shard_path, regions, speech_path)
+        savings['speech_seconds'] += sum(length for _, _, length in segments)
+        savings['calls_after'] += wit_call_estimate(wav_duration(speech_path))
+        yield speech_path, lambda seconds, segments=segments, offset=offset: to_original_time(segments, seconds) + offset
+
+def transcribe_speech(shards, wit_api_keys, progress, progress_range=(0.2, 0.7), owner=None, language_sign=''):
+    if not VAD_ENABLED:
+        return transcribe_shards(shards, wit_api_keys, progress, progress_range, owner, language_sign)
+    savings = {'audio_seconds': 0.0, 'speech_seconds': 0.0, 'calls_before': 0, 'calls_after': 0}
+    cues, failed = transcribe_shards(speech_only_shards(shards, savings), wit_api_keys, progress, progress_range, owner, language_sign)
+    print(f"VAD kept {savings['speech_seconds']:.1f}s of speech out of {savings['audio_seconds']:.1f}s, "
+          f"about {savings['calls_after']} Wit.ai calls instead of {savings['calls_before']} "
+          f"({savings['calls_before'] - savings['calls_after']} saved)")
+    return cues, failed
+
+# Pipes the audio-only stream from yt-dlp into ffmpeg, which only writes the transcription shards (nothing reads a full WAV
+# of a streamed job, the merge uses the downloaded video).
+# Yields (shard_path, offset) as soon as each shard is complete, while the rest is still downloading.
+def stream_youtube_audio_shards(youtube_url, shard_dir, shard_seconds):
+    shard_list = shard_dir / 'shards.csv'
+    download = subprocess.Popen(['yt-dlp', '-q', '-f', YOUTUBE_AUDIO_FORMAT, '-o', '-', youtube_url], stdout=subprocess.PIPE)
+    command = ['ffmpeg', '-y', '-loglevel', 'error', '-i', 'pipe:0', *EXTRACT_AUDIO_ARGS, '-f', 'segment', '-segment_time', str(shard_seconds),
+               '-segment_list', str(shard_list), '-segment_list_type', 'csv', str(shard_dir / 'shard_%04d.wav')]
+    extract = subprocess.Popen(command, stdin=download.stdout)
+    download.stdout.close()  # yt-dlp gets SIGPIPE if ffmpeg exits early
+
+    yielded = 0
+    first_start = None
+    while True:
+        finished = metrics.exited(extract)
+        rows = []
+        if shard_list.exists():
+            with open(shard_list, 'r', encoding='utf-8') as infile:
+                # ffmpeg appends one line per finished shard, a line without its newline is still being written
+                rows = [line.strip().split(',') for line in infile if line.endswith('\n')]
+        for name, start, _ in rows[yielded:]:
+            first_start = float(start) if first_start is None else first_start
+            yield shard_dir / name, float(start) - first_start
+        yielded = len(rows)
+        if finished:
+            break
+        time.sleep(0.5)
+
+    metrics.record_process(metrics.reap(download))
+    metrics.record_process(metrics.reap(extract))
+    if download.returncode != 0 or extract.returncode != 0:
+        raise subprocess.CalledProcessError(download.returncode or extract.returncode, command)
+
+# Each token is handed to one shard at a time, so the shards run concurrently without two jobs sharing a token's rate limit.
+# offset is the start of the shard in the original audio, or a function mapping shard times to original times.
+# Returns the merged cues and the number of shards that failed, their audio has no cues.
+# The router sends a shard to the local whisper model instead when Wit.ai is saturated or has no token for the language.
+def transcribe_shards(shards, wit_api_keys, progress, progress_range=(0.2, 0.7), owner=None, language_sign=''):
+    tokens = {wit_key(wit_api_key): wit_api_key for wit_api_key in wit_api_keys or []}
+    started = time.monotonic()
+
+    def run(shard_path):
+        seconds = wav_duration(shard_path)
+        cost = wit_call_estimate(seconds)
+        if transcription_router.choose(list(tokens), seconds, cost) == 'whisper':
+            with transcription_router.local(seconds):
+                metrics.add(whisper_audio_seconds=seconds)
+                return transcribe_whisper_shard(shard_path, language_sign)
+        for attempt in range(2):
+            key = scheduler.least_loaded(list(tokens))
+            with scheduler.slot(key, cost, owner) as slot:
+                metrics.add(wit_calls=cost, wit_audio_seconds=seconds)
+                cues = transcribe_shard(shard_path, [tokens[key]])
+                if cues is not None:
+                    return cues
+                # tafrigh retries 429s on its own, a shard without any output means the token was saturated
+                slot.throttle()
+        return None
+
+    shard_cues = {}
+    failed = 0
+    start, end = progress_range
+    # More shards in flight than Wit.ai tokens when the local model can take the overflow
+    workers = len(tokens) + (whisper_service.workers if transcription_router.local_available else 0)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(metrics.bind(run), shard_path): (position, shard_path, offset)
+                   for position, (shard_path, offset) in enumerate(shards)}
+        for done, future in enumerate(as_completed(futures), 1):
+            position, shard_path, offset = futures[future]
+            cues = future.result()
+            if cues is None:
+                failed += 1
+                print(f"Transcription failed for shard {shard_path.name}.")
+            if done == 1:
+                print(f"First shard transcribed after {time.monotonic() - started:.1f}s")
+            shard_cues[position] = (offset, cues or [])
+            progress(start + (end - start) * done / len(futures), "Transcribing audio file...")
+
+    merged = []
+    for position in sorted(shard_cues):
+        offset, cues = shard_cues[position]
+        to_original = offset if callable(offset) else (lambda seconds, offset=offset: seconds + offset)
+        for cue in cues:
+            merged.append(Cue(len(merged) + 1, to_original(cue.start), to_original(cue.end), cue.text))
+    print(f"Transcription backends: {transcription_router.stats()}")
+    return merged, failed
+
+# A Wit.ai token for the language or the local whisper model
+def can_transcribe(language_sign):
+    return bool(LANGUAGE_API_KEYS.get(language_sign.upper())) or transcription_router.local_available
+
+#@transcribe_queue.task
+@metrics.traced('transcribe')
+def transcribe_file(file_path, language_sign,progress=gr.Progress()):
+    progress(0.2, "Transcribing audio file...")
+    if not is_wav_file(file_path):
+        print(f"Skipping file {file_path} as it is not in WAV format.")
+        return None
+
+    wit_api_keys = LANGUAGE_API_KEYS.get(language_sign.upper())
+    if not can_transcribe(language_sign):
+        print(f"API key not found for language: {language_sign}")
+        return None
+
+    shards = split_wav_shards(file_path, TRANSCRIBE_SHARD_SECONDS)
+    cues, failed = transcribe_speech(shards, wit_api_keys, progress, owner=file_path.stem, language_sign=language_sign)
+    if shards:
+        shutil.rmtree(shards[0][0].parent, ignore_errors=True)
     progress(0.7)
+    srt_file = write_transcript(file_path, cues)
+    return Incomplete(srt_file) if failed and srt_file else srt_file
 
+def write_transcript(file_path, cues):
     srt_file = Path(os.path.join(str(file_path.parent), f"{file_path.stem}.srt"))
     txt_file = Path(os.path.join(str(file_path.parent), f"{file_path.stem}.txt"))
+    if cues:
+        write_srt(srt_file, cues)
+        with open(txt_file, 'w', encoding='utf-8') as outfile:
+            outfile.write('\n'.join(cue.text for cue in cues if cue.text) + '\n')
 
     if srt_file.exists() and srt_file.stat().st_size > 0 and txt_file.exists() and txt_file.stat().st_size > 0:
         return srt_file
@@ -148,125 +700,612 @@ def transcribe_file(file_path, language_sign,progress=gr.Progress()):
 
     return None
 
+@metrics.traced('transcribe')
+def stream_transcribe_youtube_audio(youtube_url, audio_path, language_sign, progress=gr.Progress()):
+    progress(0.05, "Transcribing audio while downloading...")
+    wit_api_keys = LANGUAGE_API_KEYS.get(language_sign.upper())
+    if not can_transcribe(language_sign):
+        print(f"API key not found for language: {language_sign}")
+        return None
+
+    audio_path.parent.mkdir(parents=True, exist_ok=True)
+    shard_dir = audio_path.with_name(audio_path.stem + '_shards')
+    shard_dir.mkdir(exist_ok=True)
+    try:
+        shards = stream_youtube_audio_shards(youtube_url, shard_dir, TRANSCRIBE_SHARD_SECONDS)
+        cues, failed = transcribe_speech(shards, wit_api_keys, progress, progress_range=(0.05, 0.7), owner=audio_path.stem,
+                                 language_sign=language_sign)
+    except subprocess.CalledProcessError as e:
+        print(f"Streaming the audio of {youtube_url} failed: {e}")
+        return None
+    finally:
+        shutil.rmtree(shard_dir, ignore_errors=True)
+    progress(0.7)
+    srt_file = write_transcript(audio_path, cues)
+    return Incomplete(srt_file) if failed and srt_file else srt_file
+
+# Downloads the video in the background while the audio is streamed and transcribed, returns the same
+# (video_file, video_key, srt_path, srt_key) the download/extract/transcribe stages would
+def stream_youtube_video(youtube_url, source_key, language_sign, unique_id, progress=gr.Progress()):
+    audio_path = Path('downloads') / f'{unique_id}.wav'
+    audio_key = artifact_store.key('stream_audio', source_key, {'format': YOUTUBE_AUDIO_FORMAT, 'args': EXTRACT_AUDIO_ARGS})
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        video_future = executor.submit(
+            metrics.bind(run_cached_stage), artifact_store, 'download', source_key, {'format': YT_DLP_FORMAT},
+            Path('downloads') / f'{unique_id}.mp4',
+            lambda: download_youtube_video(youtube_url, lambda *args, **kwargs: None, unique_id),
+        )
+        srt_path, srt_key = run_cached_stage(
+            artifact_store, 'transcribe', audio_key, transcribe_cache_params(language_sign),
+            audio_path.with_suffix('.srt'),
+            lambda: stream_transcribe_youtube_audio(youtube_url, audio_path, language_sign, progress),
+            extra_suffixes=['.txt'],
+        )
+        video_file, video_key = video_future.result()
+
+    if srt_path is None:
+        # The audio stream could not be piped (e.g. no audio-only format), extract it from the downloaded video instead
+        audio_file, audio_key = cached_extract_audio(video_key, video_file, progress)
+        srt_path, srt_key = run_cached_stage(
+            artifact_store, 'transcribe', audio_key, transcribe_cache_params(language_sign),
+            audio_file.with_suffix('.srt'),
+            lambda: transcribe_file(audio_file, language_sign, progress),
+            extra_suffixes=['.txt'],
+        )
+    return video_file, video_key, srt_path, srt_key
+
+def transcribe_cache_params(language_sign):
+    return {'language': language_sign.upper(), 'config': TRANSCRIBE_SETTINGS, 'shard_seconds': TRANSCRIBE_SHARD_SECONDS,
+            'vad': VAD_SETTINGS if VAD_ENABLED else None,
+            'whisper': whisper_service.model_name if transcription_router.local_available else None}
+
+# Words of the subtitle text only, the indices and timestamps are not counted
 def count_srt_words(srt_path):
-    with open(srt_path, 'r', encoding='utf-8') as infile:
-        content = infile.read()
-        return len(content.split())
+    return word_count(read_srt(srt_path))
+
+# Cues are sent to Claude without timestamps as "#<index>" blocks, the timestamps are put back from the source file
+def format_cue_batch(batch):
+    return '\n\n'.join(f"#{cue.index}\n{cue.text}" for cue in batch)
+
+# Incremental parser of the "#<index>" blocks, feed() takes the response as it streams in and returns the cues
+# completed so far (a cue is complete once the header of the next one arrives), close() returns the last one
+class CueBlockParser:
+    def __init__(self):
+        self.buffer = ''
+        self.index = None
+        self.lines = []
+
+    def feed(self, text):
+        self.buffer += text
+        *lines, self.buffer = self.buffer.split('\n')
+        completed = []
+        for line in lines:
+            self.read_line(line, completed)
+        return completed
+
+    def close(self):
+        completed = []
+        self.read_line(self.buffer, completed)
+        self.buffer = ''
+        if self.index is not None:
+            completed.append((self.index, '\n'.join(self.lines).strip()))
+            self.index = None
+        return completed
+
+    def read_line(self, line, completed):
+        match = re.match(r'^#(\d+)$', line.strip())
+        if match:
+            if self.index is not None:
+                completed.append((self.index, '\n'.join(self.lines).strip()))
+            self.index = int(match.group(1))
+            self.lines = []
+        elif self.index is not None:
+            self.lines.append(line)
+
+def parse_cue_batch(text):
+    parser = CueBlockParser()
+    return dict(parser.feed(text) + parser.close())
+
+# Writes the output SRT while the results come in: every cue is flushed as soon as it and all the cues before it
+# are known, so the file is always a valid prefix that a preview or a segment burn-in can already read.
+# close() writes the cues that never got a result with their source text. With expected (the indices that are sent),
+# the other cues are written right away as they are.
+class IncrementalSrtWriter:
+    def __init__(self, srt_path, cues, expected=None):
+        self.cues = cues
+        self.expected = expected
+        self.results = {}
+        self.written = 0
+        self.lock = threading.Lock()
+        self.srt_path = srt_path
+        self.outfile = open(srt_path, 'w', encoding='utf-8')
+
+    def add(self, index, text):
+        with self.lock:
+            self.results[index] = text
+            self.flush()
+
+    def flush(self, final=False):
+        start = self.written
+        while self.written < len(self.cues):
+            cue = self.cues[self.written]
+            waiting = cue.text and (self.expected is None or cue.index in self.expected)
+            if cue.index not in self.results and waiting and not final:
+                break
+            self.outfile.write(format_cue(cue, self.results.get(cue.index) or cue.text))
+            self.written += 1
+        if self.written > start:
+            self.outfile.flush()
+
+    def close(self):
+        with self.lock:
+            self.flush(final=True)
+            self.outfile.close()
+            # The next stage gets the cues from memory instead of parsing the file again
+            remember(self.srt_path, [Cue(cue.index, cue.start, cue.end, self.results.get(cue.index) or cue.text, cue.timestamp)
+                                     for cue in self.cues])
+
+# (fixed text, translation) of a cue block of the combined revise and translate request, None when the block does not
+# have both parts
+def split_revised_translation(text):
+    lines = text.split('\n')
+    for position, line in enumerate(lines):
+        if line.strip() == REVISED_TRANSLATION_SEPARATOR:
+            revised, translated = '\n'.join(lines[:position]).strip(), '\n'.join(lines[position + 1:]).strip()
+            return (revised, translated) if revised and translated else None
+    return None
+
+# Input tokens of text as counted by the API, None when the count failed
+def count_prompt_tokens(text):
+    def count():
+        metrics.add(anthropic_calls=1)
+        return anthropic_client.messages.count_tokens(model=CLAUDE_MODEL, messages=[{"role": "user", "content": text}]).input_tokens
+    try:
+        return scheduler.call('anthropic', count, anthropic_throttle_info)
+    except anthropic.APIError as e:
+        print(f"Token count failed, keeping the default estimate: {e}")
+        return None
+
+# Greedy batches of consecutive cues, each closed before its output budget passes BATCH_OUTPUT_FILL of the limit
+def plan_cue_batches(cues, task, target, batch_size):
+    limit = CLAUDE_MAX_OUTPUT_TOKENS * BATCH_OUTPUT_FILL
+    batches = []
+    batch, batch_tokens = [], 0
+    for cue in cues:
+        tokens = token_budget.estimate(format_cue_batch([cue]))
+        if batch and (len(batch) >= batch_size or token_budget.output_budget(task, target, batch_tokens + tokens, len(batch) + 1) > limit):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(cue)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+# A response cut off by max_tokens keeps its complete cues, the rest of the batch is sent again in halves with the
+# budget raised by what was learned from the truncation. context_for(batch) gives text put before the cues, it does not
+# count towards the output budget. on_cue(index, text) is called for each cue as soon as its block is complete in the
+# streamed response.
+def request_cue_batch(batch, instruction, system, owner=None, on_cue=None, task='', target='', context_for=None):
+    context = context_for(batch) if context_for else ''
+    prompt = instruction + "\n\n" + (context + "\n\n" if context else '') + format_cue_batch(batch)
+    input_tokens = token_budget.estimate(format_cue_batch(batch))
+    max_tokens_estimated = min(token_budget.output_budget(task, target, input_tokens, len(batch)), CLAUDE_MAX_OUTPUT_TOKENS)
+    timing = {}
+
+    def create():
+        timing['started'] = time.monotonic()
+        parser = CueBlockParser()
+        results = {}
+        with anthropic_client.messages.stream(
+            model=CLAUDE_MODEL,
+            max_tokens=max_tokens_estimated,
+            temperature=0.2,
+            system=system,
+            messages=[
+            {"role": "user", "content": prompt}
+        ]
+        ) as stream:
+            for text in stream.text_stream:
+                for index, cue_text in parser.feed(text):
+                    results[index] = cue_text
+                    if on_cue:
+                        on_cue(index, cue_text)
+            message = stream.get_final_message()
+        if message.stop_reason != 'max_tokens':
+            # The last cue is only known to be complete when the response ended on its own
+            for index, cue_text in parser.close():
+                results[index] = cue_text
+                if on_cue:
+                    on_cue(index, cue_text)
+        return results, message
+
+    results, message = scheduler.call('anthropic', create, anthropic_throttle_info, owner=owner)
+    output_tokens, seconds = message.usage.output_tokens, time.monotonic() - timing['started']
+    metrics.add(anthropic_calls=1, anthropic_input_tokens=message.usage.input_tokens, anthropic_output_tokens=output_tokens)
+    truncated = message.stop_reason == 'max_tokens'
+    token_budget.learn(task, target, input_tokens, output_tokens, truncated)
+    missing = [cue for cue in batch if cue.index not in results]
+    if truncated and missing and (len(missing) < len(batch) or len(batch) > 1):
+        print(f"Output of cues {batch[0].index}-{batch[-1].index} cut at {max_tokens_estimated} tokens, sending {len(missing)} cues again")
+        half = (len(missing) + 1) // 2
+        for part in (missing[:half], missing[half:]):
+            if part:
+                part_results, part_tokens, part_seconds = request_cue_batch(part, instruction, system, owner, on_cue, task, target, context_for)
+                results.update(part_results)
+                output_tokens += part_tokens
+                seconds += part_seconds
+    return results, output_tokens, seconds
+
+# Runs the cues through Claude in concurrent batches, only the cues missing from the translation memory are sent.
+# task/target are part of the memory key ('translate'/<language> or 'revise'/'').
+# on_cue(index, text) gets every result as soon as it is known, the memory hits first and then the streamed cues.
+# accept(text), when given, drops the results that are not in the expected shape, those cues keep their source text.
+def process_cues(cues, task, target, instruction, system, progress, progress_range, batch_size, max_workers, owner=None, on_cue=None, accept=None, context_for=None):
+    results = {}
+    lock = threading.Lock()
+    cached = translation_memory.get_many(CLAUDE_MODEL, task, target, [cue.text for cue in cues])
+    pending = []
+    same_text = {}  # normalized text -> indices of the cues with that text
+    for cue in cues:
+        key = normalize_cue_text(cue.text)
+        if key in cached:
+            results[cue.index] = cached[key]
+        elif cue.text:
+            if key not in same_text:
+                # Repeated lines within the same file are only sent once too
+                pending.append(cue)
+            same_text.setdefault(key, []).append(cue.index)
+    if on_cue:
+        for index in sorted(results):
+            on_cue(index, results[index])
+
+    pending_texts = {cue.index: cue.text for cue in pending}
+    start, end = progress_range
+    total = sum(1 for cue in cues if cue.text)
+
+    def received(index, result):
+        if index not in pending_texts or not result or (accept and not accept(result)):
+            return
+        with lock:
+            resolved = [same for same in same_text[normalize_cue_text(pending_texts[index])] if same not in results]
+            for same in resolved:
+                results[same] = result
+            count = len(results)
+        for same in resolved:
+            if on_cue:
+                on_cue(same, result)
+        if resolved:
+            progress(start + (end - start) * count / max(total, 1), f"{task.capitalize()} cue {count}/{total}")
+
+    if pending:
+        token_budget.calibrate([format_cue_batch([cue]) for cue in pending], count_prompt_tokens)
+    batches = plan_cue_batches(pending, task, target, batch_size)
+    if batches:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches)))) as executor:
+            futures = {executor.submit(metrics.bind(request_cue_batch), batch, instruction, system, owner, received, task, target, context_for): batch
+                       for batch in batches}
+            for future in as_completed(futures):
+                batch = futures[future]
+                try:
+                    batch_results, output_tokens, seconds = future.result()
+                except anthropic.APIError as e:
+                    print(f"{task.capitalize()} failed for cues {batch[0].index}-{batch[-1].index}: {e}")
+                    continue
+                learned = {cue.text: batch_results[cue.index] for cue in batch
+                           if batch_results.get(cue.index) and (not accept or accept(batch_results[cue.index]))}
+                translation_memory.put_many(CLAUDE_MODEL, task, target, learned, output_tokens / len(batch), seconds / len(batch))
+
+    print(f"Translation memory: {translation_memory.stats()}")
+    print(f"Token budget: {token_budget.stats()}")
+    print(f"Rate limits: {scheduler.stats()}")
+    return results
+
+# The output file is written cue by cue while the responses stream in, on_cue(index, text) lets a caller follow along.
+# With selected only those cues are sent, the others are written as they are.
+def stream_processed_cues(cues, output_path, on_cue, *args, selected=None, **kwargs):
+    writer = IncrementalSrtWriter(output_path, cues, None if selected is None else {cue.index for cue in selected})
+
+    def add(index, text):
+        writer.add(index, text)
+        if on_cue:
+            on_cue(index, text)
+
+    try:
+        return process_cues(cues if selected is None else selected, *args, on_cue=add, **kwargs)
+    finally:
+        # Stitched back in index order with the original timestamps, the source text is kept where a cue is missing
+        writer.close()
 
 #@translate_queue.task
-def translate_subtitles(srt_path, target_language, progress=gr.Progress()):
+@metrics.traced('translate')
+def translate_subtitles(srt_path, target_language, progress=gr.Progress(), batch_size=TRANSLATION_BATCH_SIZE, max_workers=TRANSLATION_MAX_WORKERS, on_cue=None):
     progress(0.85, "Translating subtitles...")
     translated_srt_path = srt_path.with_name(srt_path.stem + f'_translated_{target_language}.srt')
-    prompt = f"Translate the following SRT file to the target following language or dialect {target_language}"
-    with open(srt_path, 'r', encoding='utf-8') as infile:
-        for line in infile:
-            prompt += line
-    srt_word_count = count_srt_words(srt_path)
-    # Ratio between tokens and English words is 0.75 I think the it changes from language to language so
-    # Assumptions below to support other languages hopefully without issues
-    max_tokens_estimated = 4000  # Assuming an average of 4 tokens per word, plus an offset of 500 tokens
-    message = anthropic_client.messages.create(
-        model="claude-3-haiku-20240307",
-        max_tokens=max_tokens_estimated,
-        temperature=0.2,
-        system="Return SRT FILE FORMAT !!",
-        messages=[
-        {"role": "user", "content": prompt} 
-    ]
-    )
-    translated_srt = message.content[0].text
-    #Removing extra generated text to preserve SRT Format !!!!!!!!
-    #-------------------------------------------------------------#
-    translated_srt_lines = (translated_srt.split('\n'))[2:]
-    translated_srt = '\n'.join(translated_srt_lines)
-    #-------------------------------------------------------------#
-    with open(translated_srt_path, 'w', encoding='utf-8') as outfile:
-        outfile.write(translated_srt)
+    cues = read_srt(srt_path)
+    instruction = TRANSLATE_INSTRUCTION.format(target_language=target_language)
+    translations = stream_processed_cues(cues, translated_srt_path, on_cue, 'translate', target_language, instruction, TRANSLATE_SYSTEM,
+                                         progress, (0.85, 0.9), batch_size, max_workers, srt_path.stem)
+
+    missing = [cue.index for cue in cues if cue.text and not translations.get(cue.index)]
+    if missing:
+        print(f"Translation missing for {len(missing)} cues, keeping the original text for them.")
     progress(0.9)
-    return translated_srt_path
+    return Incomplete(translated_srt_path) if missing else translated_srt_path
 
 
-def revising_subtitles(srt_path, progress=gr.Progress()):
+@metrics.traced('revise')
+def revising_subtitles(srt_path, progress=gr.Progress(), batch_size=TRANSLATION_BATCH_SIZE, max_workers=TRANSLATION_MAX_WORKERS, on_cue=None):
     progress(0.7, "Revising subtitles ...")
     revised_srt_path = srt_path.with_name(srt_path.stem + f'_cleaned.srt')
-    with open(srt_path, 'r', encoding='utf-8') as infile:
-        srt_content = infile.read()
-
-    # Prepare the prompt for the language model
-    prompt = f"[[[PRESERVE THE SRT FILE FORMAT !!!]]] FIX WRONG SPELLED WORDS / CONSISTENCY OF THE DIALOGUES OF THE FOLLOWING SRT FILE\n{srt_content}"
-
-    
-    srt_word_count = count_srt_words(srt_path)
-    # Ratio between tokens and English words is 0.75 I think the it changes from language to language so
-    # Assumptions below to support other languages hopefully without issues
-    max_tokens_estimated = (srt_word_count * 2) * 4 + 500  # Assuming an average of 4 tokens per word, plus an offset of 500 tokens
-    message = anthropic_client.messages.create(
-        model="claude-3-haiku-20240307",
-        max_tokens=max_tokens_estimated,
-        temperature=0.2,
-        system="Respect and preserve SRT file format",
-        messages=[
-        {"role": "user", "content": prompt} 
-    ]
-    )
-    revised_srt = message.content[0].text
-    #Removing extra generated text to preserve SRT Format !!!!!!!!
-    #-------------------------------------------------------------#
-    revised_srt_lines = (revised_srt.split('\n'))[2:]
-    revised_srt = '\n'.join(revised_srt_lines)
-    #-------------------------------------------------------------#
-    with open(revised_srt_path, 'w', encoding='utf-8') as outfile:
-        outfile.write(revised_srt)
+    cues = read_srt(srt_path)
+    if REVISE_ONLY_FLAGGED:
+        flagged = revision_gate.flag(cues)
+        selected = [cue for cue in cues if cue.index in flagged]
+        reasons = Counter(reason for cue_reasons in flagged.values() for reason in cue_reasons)
+        print(f"Revision: {len(selected)}/{sum(1 for cue in cues if cue.text)} cues flagged {dict(reasons)}")
+
+        def context_for(batch):
+            context = context_cues(cues, batch, REVISION_CONTEXT_CUES)
+            return REVISION_CONTEXT_HEADER + "\n" + "\n".join(f"({cue.index}) {cue.text}" for cue in context) if context else ''
+    else:
+        selected, context_for = None, None
+
+    revisions = stream_processed_cues(cues, revised_srt_path, on_cue, 'revise', '', REVISE_INSTRUCTION, REVISE_SYSTEM, progress,
+                                      (0.7, 0.85), batch_size, max_workers, srt_path.stem, selected=selected, context_for=context_for)
+    missing = [cue.index for cue in (cues if selected is None else selected) if cue.text and not revisions.get(cue.index)]
+    if missing:
+        print(f"Revision missing for {len(missing)} cues, keeping the original text for them.")
     progress(0.9)
-    return revised_srt_path
+    return Incomplete(revised_srt_path) if missing else revised_srt_path
 
-def interface(source_type, youtube_url, file_path, language_sign, target_language):
-    output_video = None
-    progress = gr.Progress()
-    if source_type == "YouTube video":
-        if youtube_url and language_sign:
-            video_file = download_youtube_video(youtube_url, progress)
-            audio_file = extract_audio(video_file, progress)
-            srt_path = transcribe_file(audio_file, language_sign,progress)
+# Fixes and translates the subtitles with one Claude request per batch instead of a revise pass and a translate pass.
+# Both files are written while the responses stream in, the fixed one next to the translation as .cleaned.srt.
+# on_cue(index, revised, translated) lets a caller follow along.
+@metrics.traced('revise_translate')
+def revise_and_translate_subtitles(srt_path, target_language, progress=gr.Progress(), batch_size=TRANSLATION_BATCH_SIZE, max_workers=TRANSLATION_MAX_WORKERS, on_cue=None):
+    progress(0.7, "Revising and translating subtitles...")
+    translated_srt_path = srt_path.with_name(srt_path.stem + f'_translated_{target_language}.srt')
+    revised_srt_path = translated_srt_path.with_suffix('.cleaned.srt')
+    cues = read_srt(srt_path)
+    revised_writer = IncrementalSrtWriter(revised_srt_path, cues)
+    translated_writer = IncrementalSrtWriter(translated_srt_path, cues)
+
+    def add(index, text):
+        revised, translated = split_revised_translation(text)
+        revised_writer.add(index, revised)
+        translated_writer.add(index, translated)
+        if on_cue:
+            on_cue(index, revised, translated)
+
+    instruction = REVISE_TRANSLATE_INSTRUCTION.format(target_language=target_language)
+    try:
+        results = process_cues(cues, 'revise_translate', target_language, instruction, REVISE_TRANSLATE_SYSTEM,
+                               progress, (0.7, 0.9), batch_size, max_workers, srt_path.stem, add, split_revised_translation)
+    finally:
+        revised_writer.close()
+        translated_writer.close()
+
+    missing = [cue.index for cue in cues if cue.text and not results.get(cue.index)]
+    if missing:
+        print(f"Revision and translation missing for {len(missing)} cues, keeping the original text for them.")
+    progress(0.9)
+    return Incomplete(translated_srt_path) if missing else translated_srt_path
+
+# Why a job ended up without subtitles, for its error (transcribe_file and the stream only print it)
+def transcription_error(state):
+    if not can_transcribe(state['language_sign']):
+        return f"No Wit.ai API key or local Whisper model for the language {state['language_sign']}"
+    if state.get('audio_file') and not is_wav_file(state['audio_file']):
+        return f"{Path(state['audio_file']).name} is not a WAV file"
+    return "The transcription returned no subtitles (no speech was found or every request failed)"
+
+# Job steps, each runs in one of the job engine pools and keeps what the next steps need in job.state.
+# A step with nothing to hand over raises StageFailed, which fails the job with the reason
+def fetch_source_stage(job):
+    state = job.state
+    if state['source_type'] == "YouTube video":
+        # The video ID identifies the content without downloading it, the URL is the fallback
+        source_key = f"youtube:{youtube_video_id(state['youtube_url']) or state['youtube_url']}"
+        if state['streamed']:
+            # Streams and transcribes the audio while the video downloads, the transcribe step has nothing left to do
+            state['video_file'], state['source_key'], state['srt_path'], state['srt_key'] = stream_youtube_video(
+                state['youtube_url'], source_key, state['language_sign'], state['unique_id'], job.update)
+            state['source_srt_path'] = state['srt_path']
+            if not state['srt_path']:
+                raise StageFailed(transcription_error(state))
         else:
-            print("Please provide the required inputs.")
-            return None
+            state['video_file'], state['source_key'] = run_cached_stage(
+                artifact_store, 'download', source_key, {'format': YT_DLP_FORMAT},
+                Path('downloads') / f"{state['unique_id']}.mp4",
+                lambda: download_youtube_video(state['youtube_url'], job.update, state['unique_id']),
+            )
     else:
-        if file_path and language_sign:
-            uploaded_file_path = Path(file_path.name)
-            if uploaded_file_path.suffix.lower() in ['.mp4', '.mkv', '.avi']:
-                audio_file = extract_audio(uploaded_file_path, progress)
-            else:
-                audio_file = uploaded_file_path
-            srt_path = transcribe_file(audio_file, language_sign, progress)
+        uploaded_file_path = Path(state['file_path'])
+        state['source_key'] = f"file:{hash_file(uploaded_file_path)}"
+        if uploaded_file_path.suffix.lower() in ['.mp4', '.mkv', '.avi']:
+            state['video_file'] = uploaded_file_path
         else:
-            print("Please provide the required inputs.")
-            return None
+            state['audio_file'], state['audio_key'] = uploaded_file_path, state['source_key']
+
+def extract_audio_stage(job):
+    state = job.state
+    if not state.get('srt_path') and not state.get('audio_file'):
+        state['audio_file'], state['audio_key'] = cached_extract_audio(state['source_key'], state['video_file'], job.update)
+
+def transcribe_stage(job):
+    state = job.state
+    if not state.get('srt_path') and state.get('audio_file'):
+        audio_file = state['audio_file']
+        state['srt_path'], state['srt_key'] = run_cached_stage(
+            artifact_store, 'transcribe', state['audio_key'], transcribe_cache_params(state['language_sign']),
+            audio_file.with_suffix('.srt'),
+            lambda: transcribe_file(audio_file, state['language_sign'], job.update),
+            extra_suffixes=['.txt'],
+        )
+        state['source_srt_path'] = state['srt_path']
+    if not state.get('srt_path'):
+        raise StageFailed(transcription_error(state))
+
+def translate_stage(job):
+    state = job.state
+    srt_path, target_language = state['srt_path'], state['target_language']
+    translated_srt_path, srt_key = run_cached_stage(
+        artifact_store, 'translate', state['srt_key'],
+        {'target': target_language, 'model': CLAUDE_MODEL, 'prompt': [TRANSLATE_INSTRUCTION, TRANSLATE_SYSTEM]},
+        srt_path.with_name(srt_path.stem + f'_translated_{target_language}.srt'),
+        lambda: translate_subtitles(srt_path, target_language, job.update),
+    )
+    if translated_srt_path:
+        state['srt_path'], state['srt_key'], state['srt_language'] = translated_srt_path, srt_key, target_language
+        state['translated_srt_path'] = translated_srt_path
+
+def revise_stage(job):
+    state = job.state
+    srt_path = state['srt_path']
+    revised_srt_path, srt_key = run_cached_stage(
+        artifact_store, 'revise', state['srt_key'],
+        {'model': CLAUDE_MODEL, 'prompt': [REVISE_INSTRUCTION, REVISE_SYSTEM],
+         'gate': REVISE_ONLY_FLAGGED and [REVISION_CONTEXT_CUES, REVISION_WORDLIST]},
+        srt_path.with_name(srt_path.stem + '_cleaned.srt'),
+        lambda: revising_subtitles(srt_path, job.update),
+    )
+    if revised_srt_path:
+        state['srt_path'], state['srt_key'] = revised_srt_path, srt_key
+        state['revised_srt_path'] = revised_srt_path
+
+def revise_translate_stage(job):
+    state = job.state
+    srt_path, target_language = state['srt_path'], state['target_language']
+    translated_srt_path, srt_key = run_cached_stage(
+        artifact_store, 'revise_translate', state['srt_key'],
+        {'target': target_language, 'model': CLAUDE_MODEL, 'prompt': [REVISE_TRANSLATE_INSTRUCTION, REVISE_TRANSLATE_SYSTEM]},
+        srt_path.with_name(srt_path.stem + f'_translated_{target_language}.srt'),
+        lambda: revise_and_translate_subtitles(srt_path, target_language, job.update),
+        extra_suffixes=['.cleaned.srt'],
+    )
+    if translated_srt_path:
+        state['srt_path'], state['srt_key'], state['srt_language'] = translated_srt_path, srt_key, target_language
+        state['translated_srt_path'] = translated_srt_path
+        state['revised_srt_path'] = translated_srt_path.with_suffix('.cleaned.srt')
+
+def merge_stage(job):
+    state = job.state
+    video_file, srt_path = state['video_file'], state['srt_path']
+    # Subtitles from an incomplete stage have no key, the video they are merged into is not cached either
+    job.result, _ = run_cached_stage(
+        artifact_store, 'merge', state['source_key'] if state['srt_key'] else None,
+        {'srt': state['srt_key'], 'language': state['srt_language'], 'mode': state['subtitle_mode']},
+        video_file.with_name(video_file.stem + '_with_subs.mp4'),
+        lambda: merge_subtitles(video_file, srt_path, state['srt_language'], job.update, state['subtitle_mode']),
+    )
+
+# Network bound steps get more workers than the ffmpeg ones, the ffmpeg pool bounds the encoders running at once
+# (each burn-in may itself use BURN_IN_WORKERS processes)
+JOB_POOLS = {
+    'download': int(os.getenv('DOWNLOAD_WORKERS', '4')),
+    'ffmpeg': int(os.getenv('FFMPEG_WORKERS', '2')),
+    'transcribe': int(os.getenv('TRANSCRIBE_WORKERS', '8')),
+    'translate': int(os.getenv('TRANSLATE_WORKERS', '8')),
+}
+job_engine = JobEngine(JOB_POOLS)
+
+def has_required_inputs(source_type, youtube_url, file_path, language_sign):
+    return bool(language_sign and (youtube_url if source_type == "YouTube video" else file_path))
+
+# Returns the submitted Job, or None when the inputs are missing
+def submit_job(source_type, youtube_url, file_path, language_sign, target_language, subtitle_mode=SUBTITLE_MODE, revise=REVISE_SUBTITLES):
+    file_path = getattr(file_path, 'name', file_path)
+    if not has_required_inputs(source_type, youtube_url, file_path, language_sign):
+        return None
+
+    steps = [('download', fetch_source_stage)]
+    # Without a way to transcribe the language the stream would be downloaded and extracted for nothing before the fallback
+    streamed = source_type == "YouTube video" and STREAM_YOUTUBE_AUDIO and can_transcribe(language_sign)
+    is_video = source_type == "YouTube video" or Path(file_path).suffix.lower() in ['.mp4', '.mkv', '.avi']
+    if not streamed:
+        if is_video:
+            steps.append(('ffmpeg', extract_audio_stage))
+        steps.append(('transcribe', transcribe_stage))
+    if target_language:
+        steps.append(('translate', revise_translate_stage if revise else translate_stage))
+    elif revise:
+        steps.append(('translate', revise_stage))
+    if is_video:
+        steps.append(('ffmpeg', merge_stage))
 
-    if srt_path:
-        if target_language:
-            translated_srt_path = translate_subtitles(srt_path, target_language, progress)
-            if translated_srt_path:
-                srt_path = translated_srt_path
+    state = dict(
+        source_type=source_type, youtube_url=youtube_url, file_path=file_path, language_sign=language_sign,
+        target_language=target_language, subtitle_mode=subtitle_mode, revise=revise, streamed=streamed, unique_id=uuid.uuid4(),
+        video_file=None, source_key=None, audio_file=None, audio_key=None, srt_path=None, srt_key=None,
+        # The transcription and the results of each Claude step, srt_path is always the latest of them and srt_language its
+        # language (the target language once a translation succeeded), the one the subtitle track is tagged with
+        source_srt_path=None, translated_srt_path=None, revised_srt_path=None, srt_language=language_sign,
+    )
+    return job_engine.submit(steps, state)
 
-        # Merge subtitles with video
-        output_video = merge_subtitles(video_file, srt_path, language_sign, progress)
+# With JOB_API_URL set the Gradio app is only a client of a separate job API server (job_api.py)
+JOB_API_URL = os.getenv('JOB_API_URL')
 
-    return output_video
+def remote_interface(source_type, youtube_url, file_path, language_sign, target_language, subtitle_mode, revise, progress):
+    client = JobClient(JOB_API_URL)
+    file_path = getattr(file_path, 'name', file_path)
+    if not has_required_inputs(source_type, youtube_url, file_path, language_sign):
+        print("Please provide the required inputs.")
+        return None
+    job_id = client.submit(source_type, youtube_url, language_sign, target_language, subtitle_mode,
+                           file_path if source_type != "YouTube video" and file_path else None, revise=revise)
+    status = client.wait(job_id, lambda value, desc: progress(value, desc), interval=0.5)
+    if status['status'] != 'done':
+        print(f"Job {job_id} failed in {status['error']}")
+        return None
+    if 'video' not in status['outputs']:
+        print("No video to merge the subtitles with, only the SRT file was generated.")
+        return None
+    return client.download(job_id, 'video', Path('downloads') / f'{job_id}_with_subs.mp4')
+
+# The Gradio worker only follows the job, the stages themselves run in the job engine pools
+def interface(source_type, youtube_url, file_path, language_sign, target_language, subtitle_mode=SUBTITLE_MODE, revise=REVISE_SUBTITLES):
+    progress = gr.Progress()
+    if JOB_API_URL:
+        return remote_interface(source_type, youtube_url, file_path, language_sign, target_language, subtitle_mode, revise, progress)
+    job = submit_job(source_type, youtube_url, file_path, language_sign, target_language, subtitle_mode, revise)
+    if job is None:
+        print("Please provide the required inputs.")
+        return None
+
+    while not job.wait(timeout=0.5):
+        progress(job.progress, job.message or "Queued...")
+    if job.error:
+        print(f"Job {job.id} failed in {job.error}")
+    elif job.result is None:
+        # A job that got no subtitles has failed, one that is done without a video had an audio source (no merge step)
+        print("No video to merge the subtitles with, only the SRT file was generated.")
+    print(f"Job {job.id} stages (waited, ran): {[(stage, round(waited, 1), round(ran, 1)) for stage, waited, ran in job.timings]}")
+    return job.result
 
 inputs = [
     gr.Radio(choices=["YouTube video", "Local file"], label="Choose the source type:"),
     gr.Textbox(label="Enter the YouTube video link:", placeholder="YouTube URL"),
-    gr.File(label="Upload a local file:", file_types=['wav', 'mp3', 'mp4', 'mkv', 'avi']),
+    gr.File(label="Upload a local file:", file_types=['.wav', '.mp3', '.mp4', '.mkv', '.avi']),
     gr.Dropdown(choices=list(LANGUAGE_API_KEYS.keys()), label="Select the language:"),
-    gr.Dropdown(choices=['', 'en', 'ar', 'fr', 'ja', 'es', 'de', 'Darija'], label="Select the target language for translation (Optional):")
+    gr.Dropdown(choices=['', 'en', 'ar', 'fr', 'ja', 'es', 'de', 'Darija'], label="Select the target language for translation (Optional):"),
+    gr.Radio(choices=[("Subtitle track (fast, not shown by this player, for downloads)", "soft"), ("Burned into the video", "burn"), ("Burned in, re-encode only the subtitled parts", "smart")], value=SUBTITLE_MODE, label="Subtitles:"),
+    gr.Checkbox(value=REVISE_SUBTITLES, label="Fix the spelling of the transcription (done in the same pass as the translation)")
 ]
 
 output = gr.Video()
 
-demo = gr.Interface(fn=interface, concurrency_limit=4,inputs=inputs, outputs=output,title="AnaKolchi - Sous Titre Kolchiii")
+# The handlers only wait on the job engine, so many more of them can be open than jobs actually running
+GRADIO_CONCURRENCY_LIMIT = int(os.getenv('GRADIO_CONCURRENCY_LIMIT', '16'))
+
+demo = gr.Interface(fn=interface, concurrency_limit=GRADIO_CONCURRENCY_LIMIT,inputs=inputs, outputs=output,title="AnaKolchi - Sous Titre Kolchiii")
 
 #demo.queue()  # Set up a queue for the interface
 if __name__ == '__main__':
+    if os.getenv('METRICS_PORT'):
+        metrics.serve(int(os.getenv('METRICS_PORT')))
+    if transcription_router.local_available and not JOB_API_URL:
+        whisper_service.load()
     demo.queue()
     demo.launch(server_name = "0.0.0.0")
@@ -1,12 +1,35 @@
 # Used a flask to run multiple instances / threads of the streamlit app
+# A fixed pool of Streamlit processes is started up front and kept warm (the imports are paid once per process),
+# every visit is sent to the least busy healthy one. A visit holds a lease on its process for SESSION_LEASE_SECONDS, kept
+# in a cookie: the same browser coming back reuses (and renews) its lease and its process instead of taking another one.
+# Once every process is at SESSIONS_PER_WORKER the visit still goes to the least busy one, only with no healthy process
+# at all is it turned away. Processes are restarted once they have served MAX_SESSIONS_PER_WORKER visits or stayed unused
+# for IDLE_TIMEOUT_SECONDS, and the ones that stop answering the health check are replaced.
 
-from flask import Flask , redirect , url_for
+from flask import Flask , redirect , url_for, request, jsonify
 import subprocess
 import threading
 import socket
+import time
+import os
+import urllib.request
+import uuid
 
 app = Flask(__name__)
 
+POOL_SIZE = int(os.getenv('STREAMLIT_POOL_SIZE', '4'))
+BASE_PORT = int(os.getenv('STREAMLIT_BASE_PORT', '8501'))
+# Visits sent to one process at the same time before the others fill up, Streamlit serves several sessions from one process
+SESSIONS_PER_WORKER = int(os.getenv('STREAMLIT_SESSIONS_PER_WORKER', '4'))
+SESSION_LEASE_SECONDS = int(os.getenv('STREAMLIT_SESSION_LEASE_SECONDS', '1800'))
+MAX_SESSIONS_PER_WORKER = int(os.getenv('STREAMLIT_MAX_SESSIONS_PER_WORKER', '200'))
+IDLE_TIMEOUT_SECONDS = int(os.getenv('STREAMLIT_IDLE_TIMEOUT_SECONDS', '3600'))
+HEALTH_CHECK_SECONDS = int(os.getenv('STREAMLIT_HEALTH_CHECK_SECONDS', '10'))
+HEALTH_CHECK_FAILURES = 3
+# Host the visitors are redirected to, defaults to the host they reached this server with
+PUBLIC_HOST = os.getenv('PUBLIC_HOST')
+LEASE_COOKIE = 'streamlit_lease'
+
 def find_free_port(start_port=8501):
     port = start_port
     while True:
@@ -17,26 +40,164 @@ def find_free_port(start_port=8501):
             except OSError:
                 port += 1
 
-@app.route('/start_streamlit')
+class StreamlitWorker:
+    def __init__(self, port):
+        self.port = port
+        self.process = None
+        self.leases = {}  # lease ID -> expiry time of every visit sent to this process
+        self.served = 0
+        self.started = 0.0
+        self.last_used = 0.0
+        self.healthy = False
+        self.failures = 0
+        self.restarts = 0
 
-def start_streamlit():
-    port = find_free_port()
+    def start(self):
+        self.process = subprocess.Popen(["streamlit", "run", "main_AK.py", "--server.port={}".format(self.port),
+                                         "--server.headless=true"])
+        self.started = self.last_used = time.time()
+        self.leases = {}
+        self.served = 0
+        self.healthy = False
+        self.failures = 0
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+
+    def restart(self):
+        self.stop()
+        self.restarts += 1
+        self.start()
+
+    def check_health(self):
+        if self.process.poll() is not None:
+            return False
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{self.port}/_stcore/health", timeout=5) as response:
+                return response.status == 200
+        except OSError:
+            return False
+
+    def active_sessions(self, now):
+        self.leases = {lease: expiry for lease, expiry in self.leases.items() if expiry > now}
+        return len(self.leases)
+
+    def status(self, now):
+        return {
+            'port': self.port,
+            'pid': self.process.pid if self.process else None,
+            'healthy': self.healthy,
+            'active_sessions': self.active_sessions(now),
+            'served': self.served,
+            'restarts': self.restarts,
+            'uptime_seconds': round(now - self.started),
+            'idle_seconds': round(now - self.last_used),
+        }
 
-    def run_streamlit():
-        # Run Streamlit in the background
-        subprocess.Popen(["streamlit", "run", "main_AK.py", "--server.port={}".format(port)])
-    
-    threading.Thread(target=run_streamlit).start()
+class StreamlitPool:
+    def __init__(self, size, base_port):
+        self.lock = threading.Lock()
+        self.workers = []
+        port = base_port
+        for _ in range(size):
+            port = find_free_port(port)
+            self.workers.append(StreamlitWorker(port))
+            port += 1
+        self.rejected = 0
+        self.overflowed = 0
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+        threading.Thread(target=self.supervise, daemon=True).start()
+
+    # The process of the visitor's live lease, or else the healthy process with the fewest active visits and a new lease,
+    # (None, None) when no process is healthy
+    def acquire(self, lease=None):
+        now = time.time()
+        with self.lock:
+            healthy = [worker for worker in self.workers if worker.healthy]
+            for worker in healthy:
+                if worker.active_sessions(now) and lease in worker.leases:
+                    worker.leases[lease] = now + SESSION_LEASE_SECONDS
+                    worker.last_used = now
+                    return worker, lease
+            if not healthy:
+                self.rejected += 1
+                return None, None
+            worker = min(healthy, key=lambda worker: (worker.active_sessions(now), worker.served))
+            # The leases only estimate the open sessions (a closed tab keeps its lease until it expires), so a full pool
+            # still takes the visit rather than turning it away
+            if worker.active_sessions(now) >= SESSIONS_PER_WORKER:
+                self.overflowed += 1
+            lease = uuid.uuid4().hex
+            worker.leases[lease] = now + SESSION_LEASE_SECONDS
+            worker.served += 1
+            worker.last_used = now
+            return worker, lease
+
+    def supervise(self):
+        while True:
+            time.sleep(HEALTH_CHECK_SECONDS)
+            for worker in self.workers:
+                healthy = worker.check_health()
+                now = time.time()
+                with self.lock:
+                    worker.failures = 0 if healthy else worker.failures + 1
+                    worker.healthy = healthy
+                    starting = now - worker.started < HEALTH_CHECK_SECONDS * HEALTH_CHECK_FAILURES
+                    dead = worker.process.poll() is not None or (worker.failures >= HEALTH_CHECK_FAILURES and not starting)
+                    # Only recycled once nobody is using it
+                    worn_out = worker.active_sessions(now) == 0 and (
+                        worker.served >= MAX_SESSIONS_PER_WORKER or now - worker.last_used > IDLE_TIMEOUT_SECONDS)
+                    if dead or worn_out:
+                        # Out of the rotation while it restarts, the next health check puts it back
+                        worker.healthy = False
+                if dead or worn_out:
+                    print(f"Restarting Streamlit on port {worker.port} ({'unhealthy' if dead else 'recycled'})")
+                    worker.restart()
+
+    def status(self):
+        now = time.time()
+        with self.lock:
+            workers = [worker.status(now) for worker in self.workers]
+        return {
+            'size': len(workers),
+            'healthy': sum(1 for worker in workers if worker['healthy']),
+            'active_sessions': sum(worker['active_sessions'] for worker in workers),
+            'capacity': len(workers) * SESSIONS_PER_WORKER,
+            'rejected': self.rejected,
+            'overflowed': self.overflowed,
+            'workers': workers,
+        }
+
+pool = StreamlitPool(POOL_SIZE, BASE_PORT)
+
+@app.route('/start_streamlit')
+def start_streamlit():
+    worker, lease = pool.acquire(request.cookies.get(LEASE_COOKIE))
+    if worker is None:
+        return "The app is restarting, please try again in a minute.", 503, {'Retry-After': '60'}
 
-    # Replace '51.20.35.85' with your EC2 instance's IP address
-    return redirect(f"http://51.20.35.85:{port}", code=302)
+    host = PUBLIC_HOST or request.host.split(':')[0]
+    response = redirect(f"http://{host}:{worker.port}", code=302)
+    response.set_cookie(LEASE_COOKIE, lease, max_age=SESSION_LEASE_SECONDS, httponly=True, samesite='Lax')
+    return response
 
-    #local no need
-    #return "Streamlit app started !"
+@app.route('/pool')
+def pool_status():
+    return jsonify(pool.status())
 
 @app.route('/')
 def home():
     return redirect(url_for('start_streamlit'))
 
 if __name__ == '__main__':
+    pool.start()
     app.run(host='0.0.0.0', port=5000)
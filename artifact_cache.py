@@ -0,0 +1,133 @@
+# Stage level artifact store, a repeat job reuses the downloaded video, the audio and the SRT files
+# and only runs the stages whose inputs or parameters changed
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+
+
+def hash_file(file_path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as infile:
+        for chunk in iter(lambda: infile.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def youtube_video_id(youtube_url):
+    match = re.search(r'(?:v=|youtu\.be/|shorts/|embed/|live/)([A-Za-z0-9_-]{11})', youtube_url)
+    return match.group(1) if match else None
+
+
+def link_or_copy(src, dest):
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copy2(src, dest)
+
+
+class ArtifactStore:
+    def __init__(self, root='artifacts', max_bytes=20 * 1024 ** 3):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # The key of a stage is its input identity (content hash, YouTube ID or the key of the stage before it)
+    # plus every parameter that changes its output
+    def key(self, stage, source, params):
+        raw = json.dumps({'stage': stage, 'source': source, 'params': params}, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def path(self, stage, key, suffix):
+        return self.root / stage / f'{key}{suffix}'
+
+    # Materializes the cached artifact (and its side files such as the .txt next to an .srt) at dest
+    def fetch(self, stage, key, dest, extra_suffixes=()):
+        dest = Path(dest)
+        suffixes = [dest.suffix] + list(extra_suffixes)
+        cached = [self.path(stage, key, suffix) for suffix in suffixes]
+        if not all(path.exists() for path in cached):
+            self.misses += 1
+            return None
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        for path, suffix in zip(cached, suffixes):
+            target = dest.with_suffix(suffix)
+            if target.exists():
+                target.unlink()
+            link_or_copy(path, target)
+            os.utime(path)
+        self.hits += 1
+        return dest
+
+    def store(self, stage, key, src, extra_suffixes=()):
+        src = Path(src)
+        (self.root / stage).mkdir(parents=True, exist_ok=True)
+        for suffix in [src.suffix] + list(extra_suffixes):
+            source_file = src.with_suffix(suffix)
+            if not source_file.exists():
+                continue
+            # Written under a temporary name first so a concurrent job never sees a partial artifact
+            tmp_path = self.root / stage / f'.{uuid.uuid4().hex}{suffix}'
+            link_or_copy(source_file, tmp_path)
+            os.replace(tmp_path, self.path(stage, key, suffix))
+        self.evict()
+
+    # Least recently used artifacts go first once the store is over max_bytes
+    def evict(self):
+        with self.lock:
+            files = [(path.stat().st_mtime, path.stat().st_size, path) for path in self.root.glob('*/*') if path.is_file()]
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+# Returned by a compute function whose output is usable but degraded (a shard or a batch failed), the job goes on with
+# it but it is not stored, so the next job with the same input tries again
+class Incomplete:
+    def __init__(self, result):
+        self.result = result
+
+
+# The working files are hard links to the stored artifacts after a fetch or a store, so they are unlinked before a compute
+# writes the same paths (ffmpeg -y, open(..., 'w')) in place, which would rewrite the artifact of another key
+def unlink_outputs(output_path, extra_suffixes=()):
+    output_path = Path(output_path)
+    for suffix in [output_path.suffix] + list(extra_suffixes):
+        output_path.with_suffix(suffix).unlink(missing_ok=True)
+
+
+# A source of None (the output of an incomplete stage) is never cached, nor is anything derived from it: the stage
+# runs and its key is None too
+def run_cached_stage(store, stage, source, params, output_path, compute, extra_suffixes=()):
+    if source is None:
+        unlink_outputs(output_path, extra_suffixes)
+        result = compute()
+        return (result.result if isinstance(result, Incomplete) else result), None
+    key = store.key(stage, source, params)
+    if store.fetch(stage, key, output_path, extra_suffixes):
+        print(f"Reusing cached {stage} artifact {key[:12]}")
+        return Path(output_path), key
+    started = time.monotonic()
+    unlink_outputs(output_path, extra_suffixes)
+    result = compute()
+    if isinstance(result, Incomplete):
+        print(f"Not caching the incomplete {stage} artifact {key[:12]}")
+        return result.result, None
+    if result:
+        store.store(stage, key, result, extra_suffixes)
+        print(f"Stored {stage} artifact {key[:12]} ({time.monotonic() - started:.1f}s)")
+    return result, key
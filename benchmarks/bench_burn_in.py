@@ -0,0 +1,64 @@
+# Compares the single process burn-in with the segment parallel one and the smart render on a synthetic video
+#   python benchmarks/bench_burn_in.py --seconds 300 --workers 8 --cue-every 20
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+# AK_Prod checks for API keys at import time, none of the burn-in code talks to the APIs
+os.environ.setdefault('WIT_API_KEY_ENGLISH', 'benchmark')
+os.environ.setdefault('ANTHROPIC_API_KEY', 'benchmark')
+
+import AK_Prod
+from media import make_test_srt, make_test_video, probe_frames
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=int, default=120)
+    parser.add_argument('--size', default='854x480')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    # Seconds between the start of two cues, each cue lasts 2s, so larger values mean less dialogue for the smart render
+    parser.add_argument('--cue-every', type=float, default=3.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        video_path = make_test_video(tmp / 'input.mp4', args.seconds, args.size)
+        srt_path = make_test_srt(tmp / 'input.srt', args.seconds, every_seconds=args.cue_every)
+
+        started = time.perf_counter()
+        single_path = AK_Prod.burn_subtitles(video_path, srt_path, 'EN', tmp / 'single.mp4')
+        single_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        parallel_path = AK_Prod.burn_subtitles_parallel(video_path, srt_path, 'EN', tmp / 'parallel.mp4', args.workers)
+        parallel_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        smart_path = AK_Prod.smart_render_subtitles(video_path, srt_path, 'EN', tmp / 'smart.mp4', args.workers)
+        smart_seconds = time.perf_counter() - started
+
+        single_frames = probe_frames(single_path)
+        parallel_frames = probe_frames(parallel_path)
+        smart_frames = probe_frames(smart_path)
+        mismatched = sum(1 for a, b in zip(single_frames, parallel_frames) if abs(a - b) > 0.001)
+        smart_mismatched = sum(1 for a, b in zip(single_frames, smart_frames) if abs(a - b) > 0.001)
+
+        print(f"video: {args.seconds}s {args.size}, workers: {args.workers}")
+        print(f"single process: {single_seconds:.2f}s ({args.seconds / single_seconds:.1f}x realtime)")
+        print(f"segment parallel: {parallel_seconds:.2f}s ({args.seconds / parallel_seconds:.1f}x realtime)")
+        print(f"speedup: {single_seconds / parallel_seconds:.2f}x")
+        print(f"smart render: {smart_seconds:.2f}s ({args.seconds / smart_seconds:.1f}x realtime, {single_seconds / smart_seconds:.2f}x)")
+        print(f"frames: {len(single_frames)} single / {len(parallel_frames)} parallel / {len(smart_frames)} smart, "
+              f"{mismatched + smart_mismatched} with a different timestamp")
+        if len(single_frames) != len(parallel_frames) or len(single_frames) != len(smart_frames) or mismatched or smart_mismatched:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
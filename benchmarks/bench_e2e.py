@@ -0,0 +1,228 @@
+# End-to-end latency and throughput of interface(), the whole pipeline of the Gradio app, run offline: Wit.ai and
+# Anthropic are local stubs (stubs.py) and the "YouTube" videos come from a local fixture server through the real yt-dlp.
+# Every job gets its own media, so nothing is served from the artifact cache or the translation memory.
+# The results are compared with the stored baseline of the same scenario, the exit status is 1 on a regression.
+#   python benchmarks/bench_e2e.py --jobs 8 --concurrency 4 --seconds 30
+#   python benchmarks/bench_e2e.py --jobs 8 --concurrency 4 --seconds 30 --update-baseline
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import wave
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from media import make_test_video, make_variant
+from stubs import AnthropicStub, MediaServer, WitStub
+
+BASELINE_PATH = Path(__file__).resolve().parent / 'baseline_e2e.json'
+SCENARIO_ARGS = ['jobs', 'concurrency', 'seconds', 'size', 'youtube_share', 'target_language', 'subtitle_mode', 'revise',
+                 'wit_latency', 'wit_error_rate', 'claude_latency', 'claude_tokens_per_second', 'claude_error_rate',
+                 'media_latency', 'media_bytes_per_second']
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summary(values):
+    return {'p50': round(percentile(values, 0.5), 2), 'p95': round(percentile(values, 0.95), 2), 'count': len(values)}
+
+
+# Replaces tafrigh's Wit.ai client, whose URL cannot be changed: one POST per chunk of max_cutting_duration seconds,
+# retried like tafrigh does, None when no chunk got through (the shard is then throttled and sent again)
+def stub_transcribe_shard(wit_url, chunk_seconds, retries=3):
+    from subtitles import Cue
+
+    def transcribe_shard(shard_path, wit_api_keys):
+        with wave.open(str(shard_path), 'rb') as wav:
+            frames_per_chunk = int(chunk_seconds * wav.getframerate())
+            chunks = []
+            while frames := wav.readframes(frames_per_chunk):
+                chunks.append(frames)
+            rate = wav.getframerate()
+        cues, answered = [], 0
+        for position, chunk in enumerate(chunks):
+            for attempt in range(retries):
+                response = requests.post(f'{wit_url}/speech', data=chunk, headers={
+                    'Authorization': f'Bearer {wit_api_keys[0]}', 'Content-Type': 'audio/raw;encoding=signed-integer;bits=16;rate=16000;endian=little'})
+                if response.status_code == 200:
+                    break
+                time.sleep(0.2 * (attempt + 1))
+            else:
+                continue
+            answered += 1
+            text = response.json()['text']
+            if text:
+                start = position * chunk_seconds
+                cues.append(Cue(len(cues) + 1, start, start + len(chunk) / 2 / rate, text))
+        return cues if answered else None
+    return transcribe_shard
+
+
+def make_sources(args, media_dir, fixture_url):
+    video_path = make_test_video(media_dir / 'fixture.mp4', args.seconds, args.size, audio='speech', faststart=True)
+    sources = []
+    youtube_jobs = round(args.jobs * args.youtube_share)
+    for i in range(args.jobs):
+        if i < youtube_jobs:
+            sources.append(('YouTube video', f'{fixture_url}/fixture.mp4?job={i}', None))
+        else:
+            sources.append(('Local file', '', str(make_variant(video_path, media_dir / f'upload_{i}.mp4', f'job {i}'))))
+    return sources
+
+
+def run_jobs(AK_Prod, args, sources):
+    def run(source):
+        source_type, youtube_url, file_path = source
+        started = time.monotonic()
+        result = AK_Prod.interface(source_type, youtube_url, file_path, 'EN', args.target_language, args.subtitle_mode, args.revise)
+        return time.monotonic() - started, result
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        outcomes = list(executor.map(run, sources))
+    return time.monotonic() - started, outcomes
+
+
+def collect(AK_Prod, elapsed, outcomes):
+    jobs = list(AK_Prod.job_engine.jobs.values())
+    stages = defaultdict(list)
+    waits = defaultdict(list)
+    for job in jobs:
+        for stage, waited, ran in job.timings:
+            stages[stage].append(ran)
+            waits[stage].append(waited)
+    counts = defaultdict(float)
+    with AK_Prod.metrics.registry.lock:
+        for name in ('download', 'extract_audio', 'transcribe', 'translate', 'revise', 'revise_translate', 'merge'):
+            for count_name, value in AK_Prod.metrics.registry.counts[name].items():
+                if count_name in ('wit_calls', 'anthropic_calls', 'anthropic_output_tokens', 'child_cpu_seconds'):
+                    counts[count_name] += value
+    completed = [seconds for seconds, result in outcomes if result is not None]
+    return {
+        'jobs_per_hour': round(len(completed) * 3600 / elapsed, 1),
+        'failed': len(outcomes) - len(completed),
+        'latency': summary([seconds for seconds, _ in outcomes]),
+        'stages': {stage: summary(values) for stage, values in sorted(stages.items())},
+        'queue_wait': {stage: summary(values) for stage, values in sorted(waits.items())},
+        'counts': {name: round(value, 1) for name, value in sorted(counts.items())},
+    }
+
+
+# A latency regresses when it is more than tolerance slower and at least min_seconds slower (short stages are noisy)
+def regressions(result, baseline, tolerance, min_seconds):
+    found = []
+    if result['failed'] > baseline['failed']:
+        found.append(f"failed jobs {baseline['failed']} -> {result['failed']}")
+    if result['jobs_per_hour'] < baseline['jobs_per_hour'] * (1 - tolerance):
+        found.append(f"throughput {baseline['jobs_per_hour']} -> {result['jobs_per_hour']} jobs/hour")
+    pairs = [('end to end', result['latency'], baseline['latency'])]
+    pairs += [(stage, result['stages'].get(stage), before) for stage, before in baseline['stages'].items()]
+    for name, now, before in pairs:
+        if now is None:
+            continue
+        for key in ('p50', 'p95'):
+            if now[key] > before[key] * (1 + tolerance) and now[key] - before[key] >= min_seconds:
+                found.append(f"{name} {key} {before[key]}s -> {now[key]}s")
+    return found
+
+
+def print_result(result):
+    print(f"throughput: {result['jobs_per_hour']} jobs/hour, {result['failed']} failed")
+    print(f"end to end: p50 {result['latency']['p50']}s, p95 {result['latency']['p95']}s")
+    for stage, values in result['stages'].items():
+        waited = result['queue_wait'][stage]
+        print(f"  {stage:12} ran p50 {values['p50']:6.2f}s p95 {values['p95']:6.2f}s, "
+              f"waited p50 {waited['p50']:6.2f}s p95 {waited['p95']:6.2f}s ({values['count']} steps)")
+    print(f"counts: {result['counts']}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, default=8)
+    # Simultaneous interface() calls, as the Gradio workers would make them
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--seconds', type=int, default=30)
+    parser.add_argument('--size', default='640x360')
+    parser.add_argument('--youtube-share', type=float, default=0.5)
+    parser.add_argument('--target-language', default='fr')
+    parser.add_argument('--subtitle-mode', default='soft', choices=['soft', 'burn', 'smart'])
+    parser.add_argument('--revise', action='store_true')
+    parser.add_argument('--wit-latency', type=float, default=0.3)
+    parser.add_argument('--wit-error-rate', type=float, default=0.05)
+    parser.add_argument('--claude-latency', type=float, default=0.5)
+    parser.add_argument('--claude-tokens-per-second', type=float, default=150)
+    parser.add_argument('--claude-error-rate', type=float, default=0.05)
+    parser.add_argument('--media-latency', type=float, default=0.1)
+    parser.add_argument('--media-bytes-per-second', type=int, default=2 * 1024 ** 2)
+    parser.add_argument('--baseline', type=Path, default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--min-seconds', type=float, default=1.0)
+    args = parser.parse_args()
+    scenario = {name: getattr(args, name) for name in SCENARIO_ARGS}
+    scenario_key = json.dumps(scenario, sort_keys=True)
+
+    wit = WitStub(args.wit_latency, args.wit_error_rate)
+    anthropic = AnthropicStub(args.claude_latency, args.claude_error_rate, args.claude_tokens_per_second)
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        media_dir = tmp / 'media'
+        media_dir.mkdir()
+        media = MediaServer(media_dir, args.media_latency, bytes_per_second=args.media_bytes_per_second)
+        # Every file the pipeline writes (downloads, artifacts, translation memory, traces) stays in the temporary directory
+        os.chdir(tmp)
+        os.environ.update(ANTHROPIC_BASE_URL=anthropic.url, ANTHROPIC_API_KEY='benchmark', TRANSCRIBE_BACKEND='wit')
+        os.environ.setdefault('WIT_API_KEY_ENGLISH', 'benchmark-1,benchmark-2')
+        for name in ('ARTIFACT_CACHE_DIR', 'TRANSLATION_MEMORY_PATH', 'TRACE_DIR'):
+            os.environ.pop(name, None)
+        Path('downloads').mkdir()
+
+        import AK_Prod
+        AK_Prod.transcribe_shard = stub_transcribe_shard(wit.url, AK_Prod.TRANSCRIBE_SETTINGS['max_cutting_duration'])
+
+        sources = make_sources(args, media_dir, media.url)
+        elapsed, outcomes = run_jobs(AK_Prod, args, sources)
+        result = collect(AK_Prod, elapsed, outcomes)
+        AK_Prod.job_engine.shutdown()
+        media.close()
+    wit.close()
+    anthropic.close()
+
+    print(f"{args.jobs} jobs of {args.seconds}s ({args.size}), concurrency {args.concurrency}, "
+          f"{round(args.jobs * args.youtube_share)} from the fixture server")
+    print_result(result)
+    print(f"stub responses: wit {wit.stats()}, anthropic {anthropic.stats()}, media {media.stats()}")
+
+    baselines = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    if args.update_baseline:
+        baselines[scenario_key] = dict(result, machine=f'{platform.machine()}, {os.cpu_count()} cpus')
+        args.baseline.write_text(json.dumps(baselines, indent=2, sort_keys=True) + '\n')
+        print(f"baseline saved to {args.baseline}")
+        return
+    if scenario_key not in baselines:
+        print("no baseline for this scenario, save one with --update-baseline")
+        return
+    found = regressions(result, baselines[scenario_key], args.tolerance, args.min_seconds)
+    for regression in found:
+        print(f"REGRESSION: {regression}")
+    if found:
+        sys.exit(1)
+    print(f"no regression against the baseline (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+# Bytes written and extraction time per media minute for each audio profile and cached artifact format
+#   python benchmarks/bench_extract_audio.py --seconds 600
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+# AK_Prod checks for API keys at import time, the extraction code does not talk to the APIs
+os.environ.setdefault('WIT_API_KEY_ENGLISH', 'benchmark')
+os.environ.setdefault('ANTHROPIC_API_KEY', 'benchmark')
+
+import AK_Prod
+from media import make_test_video
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=int, default=120)
+    parser.add_argument('--size', default='320x240')
+    args = parser.parse_args()
+    minutes = args.seconds / 60
+
+    def noop(*_args, **_kwargs):
+        pass
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        video_path = make_test_video(tmp / 'input.mp4', args.seconds, args.size)
+        print(f"media: {args.seconds}s")
+        print(f"{'profile':<12}{'format':<8}{'MB/min':>10}{'s/min':>10}")
+        for profile, profile_args in AK_Prod.AUDIO_PROFILES.items():
+            for artifact_format, codec in AK_Prod.AUDIO_ARTIFACT_FORMATS.items():
+                job_dir = tmp / f'{profile}_{artifact_format}'
+                job_dir.mkdir()
+                job_video = job_dir / video_path.name
+                os.link(video_path, job_video)
+
+                started = time.perf_counter()
+                audio_path = AK_Prod.extract_audio(job_video, noop, profile_args)
+                written = audio_path.stat().st_size
+                if codec:
+                    compact_path = AK_Prod.compress_audio(audio_path, artifact_format)
+                    # The WAV is only a scratch file once the compact artifact exists
+                    written = compact_path.stat().st_size
+                seconds = time.perf_counter() - started
+                print(f"{profile:<12}{artifact_format:<8}{written / minutes / 1024 ** 2:>10.2f}{seconds / minutes:>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
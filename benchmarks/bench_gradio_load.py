@@ -0,0 +1,277 @@
+# Load test of the Gradio queue: N synthetic jobs submitted at once through the queue API (gradio_client), against the
+# stubbed backends of bench_e2e.py, for every concurrency_limit of the sweep. Each limit gets a fresh app process
+# (GRADIO_CONCURRENCY_LIMIT) and reports the queue wait and service time of the requests, the CPU seconds of the app and
+# its ffmpeg/yt-dlp children per job and its memory per busy worker. The knee is the smallest limit within
+# --knee-margin of the best throughput, raising the limit past it only adds queue wait inside the job engine.
+# Memory and CPU are read from /proc (Linux).
+#   python benchmarks/bench_gradio_load.py --jobs 16 --limits 1,2,4,8,16
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_e2e import stub_transcribe_shard, summary
+from media import make_test_video, make_variant
+from stubs import AnthropicStub, MediaServer, WitStub
+
+STARTED_CODES = ('PROCESSING', 'ITERATING', 'PROGRESS')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+
+
+# The app process of one sweep step: AK_Prod with the Wit.ai client pointed at the stub, run like its __main__
+def serve(port, wit_url):
+    import AK_Prod
+    AK_Prod.transcribe_shard = stub_transcribe_shard(wit_url, AK_Prod.TRANSCRIBE_SETTINGS['max_cutting_duration'])
+    AK_Prod.demo.queue()
+    AK_Prod.demo.launch(server_name='127.0.0.1', server_port=port)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def read_stat(pid):
+    with open(f'/proc/{pid}/stat', 'r') as infile:
+        # The command name can hold spaces, the fields start after its closing parenthesis
+        return infile.read().rsplit(')', 1)[1].split()
+
+
+def process_tree(pid):
+    children = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                children.setdefault(int(read_stat(entry)[1]), []).append(int(entry))
+            except (OSError, IndexError):
+                pass
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending.extend(children.get(current, ()))
+    return tree
+
+
+def rss_bytes(pids):
+    total = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/statm', 'r') as infile:
+                total += int(infile.read().split()[1]) * PAGE_SIZE
+        except OSError:
+            pass
+    return total
+
+
+# CPU seconds of the process and of the children it has reaped (the finished ffmpeg and yt-dlp runs)
+def cpu_seconds(pid):
+    fields = read_stat(pid)
+    return sum(int(value) for value in fields[11:15]) / CLOCK_TICKS
+
+
+class ResourceSampler:
+    def __init__(self, pid, interval=0.25):
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.peak_rss = max(self.peak_rss, rss_bytes(process_tree(self.pid)))
+
+    def __enter__(self):
+        self.idle_rss = rss_bytes(process_tree(self.pid))
+        self.cpu_started = cpu_seconds(self.pid)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+        self.cpu = cpu_seconds(self.pid) - self.cpu_started
+
+
+def start_app(limit, port, work_dir, wit_url, anthropic_url):
+    env = dict(os.environ, GRADIO_CONCURRENCY_LIMIT=str(limit), GRADIO_ANALYTICS_ENABLED='False',
+               ANTHROPIC_BASE_URL=anthropic_url, ANTHROPIC_API_KEY='benchmark', TRANSCRIBE_BACKEND='wit')
+    env.setdefault('WIT_API_KEY_ENGLISH', 'benchmark-1,benchmark-2')
+    for name in ('ARTIFACT_CACHE_DIR', 'TRANSLATION_MEMORY_PATH', 'TRACE_DIR', 'JOB_API_URL'):
+        env.pop(name, None)
+    (work_dir / 'downloads').mkdir(parents=True)
+    app = subprocess.Popen([sys.executable, str(Path(__file__).resolve()), '--serve', str(port), '--wit-url', wit_url],
+                           cwd=work_dir, env=env, stdout=open(work_dir / 'app.log', 'w'), stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if app.poll() is not None:
+            raise RuntimeError(f"The app exited with {app.returncode}, see {work_dir / 'app.log'}")
+        try:
+            if requests.get(f'http://127.0.0.1:{port}/', timeout=1).ok:
+                return app
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.5)
+    app.kill()
+    raise RuntimeError("The app did not start in 120s")
+
+
+# Submits every job at once and follows their status: queue wait until a worker picks the request, service time after
+def run_load(url, inputs, download_dir):
+    from gradio_client import Client
+
+    client = Client(url, verbose=False, download_files=str(download_dir), max_workers=len(inputs) + 4)
+    records = []
+
+    def follow(job, submitted):
+        started = None
+        while not job.done():
+            if started is None and job.status().code.name in STARTED_CODES:
+                started = time.monotonic()
+            time.sleep(0.05)
+        finished = time.monotonic()
+        try:
+            ok = job.result() is not None
+        except Exception as e:
+            print(f"Request failed: {e}")
+            ok = False
+        started = started or finished
+        records.append({'queue_wait': started - submitted, 'service': finished - started, 'ok': ok})
+
+    threads = []
+    began = time.monotonic()
+    for job_inputs in inputs:
+        submitted = time.monotonic()
+        # The app has one endpoint, its api_name depends on the Gradio version ('/predict' or '/interface')
+        job = client.submit(*job_inputs, fn_index=0)
+        threads.append(threading.Thread(target=follow, args=(job, submitted)))
+        threads[-1].start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - began
+    client.close()
+    return elapsed, records
+
+
+def make_inputs(args, limit, media_dir, media_url, video_path):
+    from gradio_client import handle_file
+
+    inputs = []
+    youtube_jobs = round(args.jobs * args.youtube_share)
+    for i in range(args.jobs):
+        # Other URLs and other file bytes for every job and limit, so no run is served from the artifact cache
+        if i < youtube_jobs:
+            source = ('YouTube video', f'{media_url}/{video_path.name}?limit={limit}&job={i}', None)
+        else:
+            upload = make_variant(video_path, media_dir / f'upload_{limit}_{i}.mp4', f'limit {limit} job {i}')
+            source = ('Local file', '', handle_file(str(upload)))
+        inputs.append((*source, 'EN', args.target_language, args.subtitle_mode, args.revise))
+    return inputs
+
+
+def sweep_step(args, limit, tmp, stubs, video_path):
+    wit, anthropic, media = stubs
+    work_dir = tmp / f'limit_{limit}'
+    inputs = make_inputs(args, limit, media.directory, media.url, video_path)
+    port = free_port()
+    app = start_app(limit, port, work_dir, wit.url, anthropic.url)
+    try:
+        with ResourceSampler(app.pid) as resources:
+            elapsed, records = run_load(f'http://127.0.0.1:{port}/', inputs, work_dir / 'client')
+    finally:
+        app.terminate()
+        app.wait(timeout=30)
+    completed = sum(1 for record in records if record['ok'])
+    busy_workers = min(limit, args.jobs)
+    return {
+        'limit': limit,
+        'jobs_per_hour': completed * 3600 / elapsed,
+        'failed': len(records) - completed,
+        'queue_wait': summary([record['queue_wait'] for record in records]),
+        'service': summary([record['service'] for record in records]),
+        'cpu_per_job': resources.cpu / max(1, completed),
+        'peak_rss_mb': resources.peak_rss / 1024 ** 2,
+        'rss_per_worker_mb': max(0, resources.peak_rss - resources.idle_rss) / busy_workers / 1024 ** 2,
+    }
+
+
+def knee(results, margin):
+    best = max(result['jobs_per_hour'] for result in results)
+    return min(result['limit'] for result in results if result['jobs_per_hour'] >= best * (1 - margin))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--serve', type=int, metavar='PORT', help=argparse.SUPPRESS)
+    parser.add_argument('--wit-url', help=argparse.SUPPRESS)
+    parser.add_argument('--jobs', type=int, default=16)
+    parser.add_argument('--limits', default='1,2,4,8,16')
+    parser.add_argument('--seconds', type=int, default=30)
+    parser.add_argument('--size', default='640x360')
+    parser.add_argument('--youtube-share', type=float, default=0.5)
+    parser.add_argument('--target-language', default='fr')
+    parser.add_argument('--subtitle-mode', default='soft', choices=['soft', 'burn', 'smart'])
+    parser.add_argument('--revise', action='store_true')
+    parser.add_argument('--wit-latency', type=float, default=0.3)
+    parser.add_argument('--wit-error-rate', type=float, default=0.05)
+    parser.add_argument('--claude-latency', type=float, default=0.5)
+    parser.add_argument('--claude-tokens-per-second', type=float, default=150)
+    parser.add_argument('--claude-error-rate', type=float, default=0.05)
+    parser.add_argument('--media-latency', type=float, default=0.1)
+    parser.add_argument('--media-bytes-per-second', type=int, default=2 * 1024 ** 2)
+    # Throughput within this fraction of the best counts as the plateau
+    parser.add_argument('--knee-margin', type=float, default=0.05)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.serve, args.wit_url)
+        return
+
+    # Run in increasing order so the table reads as the sweep, whatever the order given
+    limits = sorted({int(limit) for limit in args.limits.split(',')})
+    wit = WitStub(args.wit_latency, args.wit_error_rate)
+    anthropic = AnthropicStub(args.claude_latency, args.claude_error_rate, args.claude_tokens_per_second)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        media_dir = tmp / 'media'
+        media_dir.mkdir()
+        media = MediaServer(media_dir, args.media_latency, bytes_per_second=args.media_bytes_per_second)
+        video_path = make_test_video(media_dir / 'fixture.mp4', args.seconds, args.size, audio='speech', faststart=True)
+        for limit in limits:
+            result = sweep_step(args, limit, tmp, (wit, anthropic, media), video_path)
+            results.append(result)
+            print(f"concurrency_limit={limit}: {result['jobs_per_hour']:.0f} jobs/hour, {result['failed']} failed, "
+                  f"queue wait p50 {result['queue_wait']['p50']}s p95 {result['queue_wait']['p95']}s, "
+                  f"service p50 {result['service']['p50']}s p95 {result['service']['p95']}s", flush=True)
+        media.close()
+    wit.close()
+    anthropic.close()
+
+    print(f"\n{args.jobs} simultaneous jobs of {args.seconds}s ({args.size}) on {os.cpu_count()} cpus")
+    print(f"{'limit':>5} {'jobs/h':>8} {'failed':>6} {'wait p50':>9} {'wait p95':>9} {'svc p50':>8} {'svc p95':>8} "
+          f"{'cpu s/job':>9} {'peak MB':>8} {'MB/worker':>9}")
+    for result in results:
+        print(f"{result['limit']:>5} {result['jobs_per_hour']:>8.0f} {result['failed']:>6} "
+              f"{result['queue_wait']['p50']:>9.2f} {result['queue_wait']['p95']:>9.2f} "
+              f"{result['service']['p50']:>8.2f} {result['service']['p95']:>8.2f} {result['cpu_per_job']:>9.2f} "
+              f"{result['peak_rss_mb']:>8.0f} {result['rss_per_worker_mb']:>9.1f}")
+    print(f"knee: concurrency_limit={knee(results, args.knee_margin)} "
+          f"(smallest limit within {args.knee_margin:.0%} of the best throughput)")
+    print(f"stub responses: wit {wit.stats()}, anthropic {anthropic.stats()}, media {media.stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+# Jobs per hour of the staged job engine against the previous model, where each of concurrency_limit=4 Gradio workers
+# ran a whole job from download to merge. The network stages are simulated with sleeps and the ffmpeg stages
+# re-encode a synthetic video, every other job is encode heavy and the rest wait mostly on the APIs.
+#   python benchmarks/bench_job_engine.py --jobs 16 --seconds 20
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+# AK_Prod checks for API keys at import time, the benchmark does not talk to the APIs
+os.environ.setdefault('WIT_API_KEY_ENGLISH', 'benchmark')
+os.environ.setdefault('ANTHROPIC_API_KEY', 'benchmark')
+
+import AK_Prod
+from job_engine import Job, JobEngine
+from media import make_test_video
+
+
+def make_steps(video_path, output_dir, network_seconds, encode_passes):
+    def encode(job):
+        for i in range(encode_passes):
+            output_path = output_dir / f"{job.id}_{i}.mp4"
+            subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-i', str(video_path), '-c:v', 'libx264',
+                            '-preset', 'veryfast', '-c:a', 'copy', str(output_path)], check=True)
+            output_path.unlink()
+
+    def fetch_source_stage(job):
+        time.sleep(network_seconds[0])
+
+    def extract_audio_stage(job):
+        output_path = output_dir / f"{job.id}.wav"
+        subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-i', str(video_path), *AK_Prod.EXTRACT_AUDIO_ARGS, str(output_path)], check=True)
+        output_path.unlink()
+
+    def transcribe_stage(job):
+        time.sleep(network_seconds[1])
+
+    def translate_stage(job):
+        time.sleep(network_seconds[2])
+
+    def merge_stage(job):
+        encode(job)
+
+    return [('download', fetch_source_stage), ('ffmpeg', extract_audio_stage), ('transcribe', transcribe_stage),
+            ('translate', translate_stage), ('ffmpeg', merge_stage)]
+
+
+def workload(count, video_path, output_dir, network_scale):
+    jobs = []
+    for i in range(count):
+        if i % 2:
+            jobs.append(make_steps(video_path, output_dir, [0.5 * network_scale, 1 * network_scale, 1 * network_scale], 3))
+        else:
+            jobs.append(make_steps(video_path, output_dir, [2 * network_scale, 6 * network_scale, 4 * network_scale], 1))
+    return jobs
+
+
+def run_whole_jobs(jobs, concurrency_limit):
+    def run(steps):
+        job = Job(steps, {})
+        for _, fn in steps:
+            fn(job)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency_limit) as executor:
+        list(executor.map(run, jobs))
+    return time.perf_counter() - started
+
+
+def run_staged_jobs(jobs, pools):
+    engine = JobEngine(pools)
+    started = time.perf_counter()
+    submitted = [engine.submit(steps, {}) for steps in jobs]
+    for job in submitted:
+        job.wait()
+    elapsed = time.perf_counter() - started
+    engine.shutdown()
+    failed = [job for job in submitted if job.status != 'done']
+    if failed:
+        raise RuntimeError(f"{len(failed)} jobs failed: {failed[0].error}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, default=16)
+    parser.add_argument('--seconds', type=int, default=20)
+    parser.add_argument('--concurrency-limit', type=int, default=4)
+    # Multiplies the simulated download, transcription and translation waits
+    parser.add_argument('--network-scale', type=float, default=1.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        video_path = make_test_video(tmp / 'input.mp4', args.seconds, '640x360')
+
+        whole_seconds = run_whole_jobs(workload(args.jobs, video_path, tmp, args.network_scale), args.concurrency_limit)
+        staged_seconds = run_staged_jobs(workload(args.jobs, video_path, tmp, args.network_scale), AK_Prod.JOB_POOLS)
+
+    print(f"{args.jobs} jobs, {args.seconds}s videos, pools: {AK_Prod.JOB_POOLS}")
+    print(f"whole job per worker (concurrency_limit={args.concurrency_limit}): {whole_seconds:.1f}s, "
+          f"{args.jobs * 3600 / whole_seconds:.0f} jobs/hour")
+    print(f"staged pools: {staged_seconds:.1f}s, {args.jobs * 3600 / staged_seconds:.0f} jobs/hour "
+          f"({whole_seconds / staged_seconds:.2f}x)")
+
+
+if __name__ == '__main__':
+    main()
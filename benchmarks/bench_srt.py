@@ -0,0 +1,106 @@
+# Microbenchmarks of the SRT model (subtitles.py) against the text based helpers it replaced, on a 10k cue file
+#   python benchmarks/bench_srt.py --cues 10000
+
+import argparse
+import re
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import subtitles
+
+
+# The helpers as they were before subtitles.py, cues were (index, timestamp line, text) tuples
+def text_read(srt_path):
+    with open(srt_path, 'r', encoding='utf-8') as infile:
+        content = infile.read().lstrip('\ufeff')
+    cues = []
+    for block in re.split(r'\n\s*\n', content.strip()):
+        lines = block.strip().split('\n')
+        for i, line in enumerate(lines):
+            if '-->' in line:
+                cues.append((len(cues) + 1, line.strip(), '\n'.join(lines[i + 1:]).strip()))
+                break
+    return cues
+
+
+def text_write(srt_path, cues):
+    with open(srt_path, 'w', encoding='utf-8') as outfile:
+        for index, timestamp, text in cues:
+            outfile.write(f"{index}\n{timestamp}\n{text}\n\n")
+
+
+def text_parse_time(value):
+    hours, minutes, seconds = value.strip().replace(',', '.').split(':')
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def text_slice(cues, start, end):
+    sliced = []
+    for _, timestamp, text in cues:
+        cue_start, cue_end = [text_parse_time(value) for value in timestamp.split('-->')]
+        if cue_end <= start or cue_start >= end:
+            continue
+        sliced.append((len(sliced) + 1, f"{subtitles.format_time(max(cue_start, start) - start)} --> "
+                                        f"{subtitles.format_time(min(cue_end, end) - start)}", text))
+    return sliced
+
+
+def text_word_count(srt_path):
+    with open(srt_path, 'r', encoding='utf-8') as infile:
+        return len(infile.read().split())
+
+
+def make_srt(srt_path, count):
+    cues = [subtitles.Cue(i, i * 2.0, i * 2.0 + 1.5, f"Subtitle number {i} says a few words\nand a second line")
+            for i in range(1, count + 1)]
+    subtitles.write_srt(srt_path, cues)
+    return cues
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cues', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    # Number of segments the burn-in slices the cues into
+    parser.add_argument('--segments', type=int, default=16)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        srt_path = Path(tmp) / 'input.srt'
+        out_path = Path(tmp) / 'output.srt'
+        make_srt(srt_path, args.cues)
+        tuples = text_read(srt_path)
+        cues = list(subtitles.iter_srt(srt_path.read_text(encoding='utf-8')))
+        duration = args.cues * 2.0
+        bounds = [duration * i / args.segments for i in range(args.segments + 1)]
+
+        def parse_model():
+            with open(srt_path, 'r', encoding='utf-8') as infile:
+                return list(subtitles.iter_srt(infile.read()))
+
+        cases = [
+            ('parse', lambda: text_read(srt_path), parse_model),
+            ('parse (same file again)', lambda: text_read(srt_path), lambda: subtitles.read_srt(srt_path)),
+            ('write', lambda: text_write(out_path, tuples), lambda: subtitles.write_srt(out_path, cues)),
+            ('slice into segments', lambda: [text_slice(tuples, a, b) for a, b in zip(bounds, bounds[1:])],
+             lambda: [subtitles.slice_cues(cues, a, b) for a, b in zip(bounds, bounds[1:])]),
+            ('word count', lambda: text_word_count(srt_path), lambda: subtitles.word_count(subtitles.read_srt(srt_path))),
+        ]
+
+        print(f"{args.cues} cues, best of {args.repeat}")
+        print(f"{'':<26}{'text ms':>10}{'model ms':>10}{'speedup':>10}")
+        for name, text_fn, model_fn in cases:
+            text_ms = min(timeit.repeat(text_fn, number=1, repeat=args.repeat)) * 1000
+            model_ms = min(timeit.repeat(model_fn, number=1, repeat=args.repeat)) * 1000
+            print(f"{name:<26}{text_ms:>10.2f}{model_ms:>10.2f}{text_ms / model_ms:>9.1f}x")
+
+        print(f"word count: {text_word_count(srt_path)} counted on the text, "
+              f"{subtitles.word_count(cues)} words of subtitle text")
+
+
+if __name__ == '__main__':
+    main()
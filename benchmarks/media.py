@@ -0,0 +1,61 @@
+# Synthetic test media for the benchmarks, generated with ffmpeg so no real videos or API keys are needed
+
+import subprocess
+
+
+# A voice-like tone: a pitch around 180 Hz at a syllable rate of 4 Hz, talking for 2.5s out of every 4s so the VAD
+# has pauses to cut
+SPEECH_LIKE = "0.5*sin(2*PI*(180+20*sin(2*PI*0.5*t))*t)*(0.6+0.4*sin(2*PI*4*t))*lt(mod(t,4),2.5)"
+
+
+def audio_source(kind, seconds):
+    if kind == 'speech':
+        return f"aevalsrc='{SPEECH_LIKE}':s=16000:d={seconds}"
+    return f'sine=frequency=440:duration={seconds}'
+
+
+# faststart puts the index first, so the file can be read from a pipe (e.g. when yt-dlp streams it to ffmpeg)
+def make_test_video(output_path, seconds=60, size='854x480', fps=25, gop_seconds=2, audio='tone', faststart=False):
+    command = ['ffmpeg', '-y', '-loglevel', 'error',
+               '-f', 'lavfi', '-i', f'testsrc2=duration={seconds}:size={size}:rate={fps}',
+               '-f', 'lavfi', '-i', audio_source(audio, seconds),
+               '-c:v', 'libx264', '-preset', 'ultrafast', '-g', str(fps * gop_seconds), '-pix_fmt', 'yuv420p',
+               '-c:a', 'aac', '-shortest', *(['-movflags', '+faststart'] if faststart else []), str(output_path)]
+    subprocess.run(command, check=True)
+    return output_path
+
+
+def make_test_audio(output_path, seconds=60, audio='speech'):
+    command = ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'lavfi', '-i', audio_source(audio, seconds), str(output_path)]
+    subprocess.run(command, check=True)
+    return output_path
+
+
+# Same media with other bytes (a different comment tag), so every job misses the content-addressed caches
+def make_variant(input_path, output_path, tag):
+    command = ['ffmpeg', '-y', '-loglevel', 'error', '-i', str(input_path), '-map', '0', '-c', 'copy',
+               '-metadata', f'comment={tag}', str(output_path)]
+    subprocess.run(command, check=True)
+    return output_path
+
+
+# One cue of cue_seconds every every_seconds, with a gap of silence (no cue) between them
+def make_test_srt(output_path, seconds=60, every_seconds=3.0, cue_seconds=2.0, first_cue=0.0):
+    def srt_time(value):
+        milliseconds = int(round(value * 1000))
+        return f"{milliseconds // 3600000:02d}:{milliseconds // 60000 % 60:02d}:{milliseconds // 1000 % 60:02d},{milliseconds % 1000:03d}"
+
+    with open(output_path, 'w', encoding='utf-8') as outfile:
+        index = 1
+        start = first_cue
+        while start + cue_seconds <= seconds:
+            outfile.write(f"{index}\n{srt_time(start)} --> {srt_time(start + cue_seconds)}\nSubtitle line number {index}\n\n")
+            index += 1
+            start += every_seconds
+    return output_path
+
+
+def probe_frames(video_path):
+    command = ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'frame=pts_time', '-of', 'csv=p=0', str(video_path)]
+    result = subprocess.run(command, check=True, capture_output=True, text=True)
+    return [float(line.strip().strip(',')) for line in result.stdout.split() if line.strip().strip(',')]
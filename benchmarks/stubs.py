@@ -0,0 +1,203 @@
+# Local stand-ins for the services the pipeline talks to, so the end-to-end benchmarks run offline and for free. Each is
+# an HTTP server on 127.0.0.1 with a latency and an error rate:
+#   WitStub        POST /speech, Wit.ai's speech endpoint, answers silence with no text
+#   AnthropicStub  POST /v1/messages (streamed as server-sent events like the real API) and /v1/messages/count_tokens,
+#                  it echoes the numbered cues back in the shape the prompt asks for
+#   MediaServer    GET /<file name>, fixture videos for yt-dlp, sent at a limited bandwidth
+
+import array
+import itertools
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+CUE_BLOCK = re.compile(r'^#(\d+)\n(.*?)(?=\n\n#\d+\n|\Z)', re.MULTILINE | re.DOTALL)
+# Mean absolute amplitude of 16 bit PCM under which a chunk is silence
+SILENCE_LEVEL = 300
+
+
+class StubServer:
+    def __init__(self, latency=0.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = Counter()  # status -> responses
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.handle(self, 'GET')
+
+            def do_POST(self):
+                stub.handle(self, 'POST')
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def handle(self, request, method):
+        body = request.rfile.read(int(request.headers.get('Content-Length') or 0)) if method == 'POST' else b''
+        with self.lock:
+            failed = self.random.random() < self.error_rate
+        time.sleep(self.latency)
+        status = self.fail(request) if failed else self.respond(request, method, body)
+        with self.lock:
+            self.requests[status] += 1
+
+    def send_json(self, request, status, value, headers=()):
+        body = json.dumps(value).encode('utf-8')
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(body)))
+        for name, header in headers:
+            request.send_header(name, header)
+        request.end_headers()
+        request.wfile.write(body)
+        return status
+
+    def fail(self, request):
+        return self.send_json(request, 500, {'error': 'stub failure'})
+
+    def respond(self, request, method, body):
+        raise NotImplementedError
+
+    def stats(self):
+        with self.lock:
+            return dict(self.requests)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# The text of a chunk names the request, so no two cues are alike and every job misses the translation memory
+class WitStub(StubServer):
+    def __init__(self, latency=0.3, error_rate=0.0, seed=0):
+        super().__init__(latency, error_rate, seed)
+        self.counter = itertools.count(1)
+
+    def fail(self, request):
+        return self.send_json(request, 429, {'error': 'Too many requests', 'code': 'rate-limit'})
+
+    def respond(self, request, method, body):
+        if method != 'POST' or request.path.split('?')[0] != '/speech':
+            return self.send_json(request, 404, {'error': 'not found'})
+        samples = array.array('h', body[:len(body) - len(body) % 2])
+        level = sum(map(abs, samples)) / len(samples) if samples else 0
+        text = f'benchmark sentence number {next(self.counter)} about the weather today' if level > SILENCE_LEVEL else ''
+        return self.send_json(request, 200, {'text': text, 'is_final': True})
+
+
+def echo_cue(text, system):
+    if "'=>'" in system:
+        return f'{text}\n=>\n[translated] {text}'
+    if 'translation' in system:
+        return f'[translated] {text}'
+    return text
+
+
+class AnthropicStub(StubServer):
+    def __init__(self, latency=0.5, error_rate=0.0, tokens_per_second=150.0, seed=0):
+        super().__init__(latency, error_rate, seed)
+        self.tokens_per_second = tokens_per_second
+        self.message_ids = itertools.count(1)
+
+    def fail(self, request):
+        with self.lock:
+            overloaded = self.random.random() < 0.5
+        if overloaded:
+            return self.send_json(request, 529, {'type': 'error', 'error': {'type': 'overloaded_error', 'message': 'Overloaded'}})
+        return self.send_json(request, 429, {'type': 'error', 'error': {'type': 'rate_limit_error', 'message': 'Rate limited'}},
+                              headers=[('retry-after', '1')])
+
+    def respond(self, request, method, body):
+        path = request.path.split('?')[0]
+        if method != 'POST' or path not in ('/v1/messages', '/v1/messages/count_tokens'):
+            return self.send_json(request, 404, {'type': 'error', 'error': {'type': 'not_found_error', 'message': path}})
+        payload = json.loads(body)
+        prompt = '\n'.join(message['content'] if isinstance(message['content'], str) else
+                           ''.join(block.get('text', '') for block in message['content']) for message in payload['messages'])
+        system = payload.get('system') or ''
+        input_tokens = max(1, math.ceil(len(system + prompt) / 4))
+        if path.endswith('count_tokens'):
+            return self.send_json(request, 200, {'input_tokens': input_tokens})
+
+        text = '\n\n'.join(f'#{index}\n{echo_cue(cue.strip(), system)}' for index, cue in CUE_BLOCK.findall(prompt))
+        # About four characters a token, cut where max_tokens would cut the real response
+        max_chars = payload.get('max_tokens', 4096) * 4
+        stop_reason = 'max_tokens' if len(text) > max_chars else 'end_turn'
+        text = text[:max_chars]
+        if not payload.get('stream'):
+            return self.send_json(request, 200, self.message(payload, input_tokens, text, stop_reason))
+        self.stream(request, payload, input_tokens, text, stop_reason)
+        return 200
+
+    def message(self, payload, input_tokens, text, stop_reason):
+        return {'id': f'msg_stub_{next(self.message_ids)}', 'type': 'message', 'role': 'assistant', 'model': payload['model'],
+                'content': [{'type': 'text', 'text': text}], 'stop_reason': stop_reason, 'stop_sequence': None,
+                'usage': {'input_tokens': input_tokens, 'output_tokens': max(1, math.ceil(len(text) / 4))}}
+
+    # The events of a streamed message, the text sent in chunks of 20 tokens at tokens_per_second
+    def stream(self, request, payload, input_tokens, text, stop_reason):
+        request.send_response(200)
+        request.send_header('Content-Type', 'text/event-stream')
+        request.send_header('Cache-Control', 'no-cache')
+        request.send_header('Connection', 'close')
+        request.end_headers()
+
+        def event(name, data):
+            request.wfile.write(f'event: {name}\ndata: {json.dumps(data)}\n\n'.encode('utf-8'))
+            request.wfile.flush()
+
+        message = self.message(payload, input_tokens, '', None)
+        message['content'], message['usage']['output_tokens'] = [], 1
+        event('message_start', {'type': 'message_start', 'message': message})
+        event('content_block_start', {'type': 'content_block_start', 'index': 0, 'content_block': {'type': 'text', 'text': ''}})
+        chunk = 80
+        for position in range(0, len(text), chunk):
+            time.sleep(chunk / 4 / self.tokens_per_second)
+            event('content_block_delta', {'type': 'content_block_delta', 'index': 0,
+                                          'delta': {'type': 'text_delta', 'text': text[position:position + chunk]}})
+        event('content_block_stop', {'type': 'content_block_stop', 'index': 0})
+        event('message_delta', {'type': 'message_delta', 'delta': {'stop_reason': stop_reason, 'stop_sequence': None},
+                                'usage': {'output_tokens': max(1, math.ceil(len(text) / 4))}})
+        event('message_stop', {'type': 'message_stop'})
+
+
+# Query strings are ignored, so ?job=<n> gives every job its own URL (and cache key) for the same file
+class MediaServer(StubServer):
+    def __init__(self, directory, latency=0.1, error_rate=0.0, bytes_per_second=5 * 1024 ** 2, seed=0):
+        super().__init__(latency, error_rate, seed)
+        self.directory = Path(directory)
+        self.bytes_per_second = bytes_per_second
+
+    def respond(self, request, method, body):
+        path = self.directory / request.path.split('?')[0].lstrip('/')
+        if method != 'GET' or not path.is_file() or path.parent != self.directory:
+            return self.send_json(request, 404, {'error': 'not found'})
+        size = path.stat().st_size
+        request.send_response(200)
+        request.send_header('Content-Type', 'video/mp4' if path.suffix == '.mp4' else 'application/octet-stream')
+        request.send_header('Content-Length', str(size))
+        request.end_headers()
+        chunk = 64 * 1024
+        try:
+            with open(path, 'rb') as infile:
+                while data := infile.read(chunk):
+                    request.wfile.write(data)
+                    time.sleep(len(data) / self.bytes_per_second)
+        except (BrokenPipeError, ConnectionResetError):
+            # yt-dlp probing the file, or ffmpeg exiting early
+            pass
+        return 200
@@ -0,0 +1,151 @@
+# Headless HTTP API over the job engine. A job is submitted with POST /jobs and the ID comes back right away,
+# clients poll GET /jobs/<id> for the status and progress and download the outputs once the job is done:
+#   curl -F source_type="YouTube video" -F youtube_url=... -F language_sign=EN localhost:8000/jobs
+#   curl localhost:8000/jobs/<id>
+#   curl -O localhost:8000/jobs/<id>/video
+
+import os
+import uuid
+from pathlib import Path
+
+from flask import Flask, Response, abort, jsonify, request, send_file, url_for
+from werkzeug.utils import secure_filename
+
+import AK_Prod
+import metrics
+
+app = Flask(__name__)
+
+UPLOAD_DIR = Path(os.getenv('UPLOAD_DIR', 'uploads'))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Output files of a finished job, by the name used in the download URL
+OUTPUTS = {
+    # The transcription, before any revision or translation
+    'srt': lambda job: job.state.get('source_srt_path'),
+    'txt': lambda job: job.state.get('source_srt_path') and Path(job.state['source_srt_path']).with_suffix('.txt'),
+    'translated': lambda job: job.state.get('translated_srt_path'),
+    'video': lambda job: job.result,
+    'cleaned': lambda job: job.state.get('revised_srt_path'),
+    # One JSON line per timing span of the job
+    'trace': lambda job: metrics.trace_path(job.id),
+}
+
+
+def output_path(job, kind):
+    if job.status != 'done' or kind not in OUTPUTS:
+        return None
+    path = OUTPUTS[kind](job)
+    return Path(path) if path and Path(path).exists() else None
+
+
+def job_status(job):
+    return {
+        'job_id': job.id,
+        'status': job.status,
+        'stage': job.stage,
+        'progress': round(job.progress, 3),
+        'message': job.message,
+        'error': job.error,
+        'created': job.created,
+        'finished': job.finished,
+        'timings': [{'stage': stage, 'waited': round(waited, 2), 'ran': round(ran, 2)} for stage, waited, ran in job.timings],
+        'outputs': {kind: url_for('download_output', job_id=job.id, kind=kind)
+                    for kind in OUTPUTS if output_path(job, kind)},
+    }
+
+
+# A JSON boolean as it is, a form or query string field as '1', 'true' or 'on'
+def flag(value, default):
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'on')
+
+
+def upload_path(filename):
+    upload_dir = UPLOAD_DIR / uuid.uuid4().hex
+    upload_dir.mkdir(parents=True, exist_ok=True)
+    # The extension decides how the pipeline treats the file, so it survives even when the name itself does not
+    name, suffix = Path(filename or '').stem, Path(filename or '').suffix
+    return upload_dir / ((secure_filename(name) or 'upload') + (f'.{secure_filename(suffix)}' if suffix else ''))
+
+
+# The file is either the raw request body (Content-Type application/octet-stream, the fields and the filename in the
+# query string) or the 'file' part of a multipart form. Either way it goes to disk in chunks, in its own directory
+# where the pipeline also writes the audio, subtitles and video of the job.
+@app.post('/jobs')
+def submit():
+    file_path = None
+    raw_upload = request.mimetype == 'application/octet-stream'
+    fields = request.args if raw_upload else (request.get_json(silent=True) or request.form)
+    subtitle_mode = fields.get('subtitle_mode') or AK_Prod.SUBTITLE_MODE
+    if subtitle_mode not in AK_Prod.SUBTITLE_MODES:
+        return jsonify({'error': f"subtitle_mode must be one of {', '.join(AK_Prod.SUBTITLE_MODES)}."}), 400
+
+    if raw_upload:
+        file_path = upload_path(fields.get('filename'))
+        with open(file_path, 'wb') as outfile:
+            for chunk in iter(lambda: request.stream.read(UPLOAD_CHUNK_SIZE), b''):
+                outfile.write(chunk)
+    else:
+        upload = request.files.get('file')
+        if upload and upload.filename:
+            # Werkzeug spools the upload to a temporary file, save() copies it over in chunks
+            file_path = upload_path(upload.filename)
+            upload.save(file_path, UPLOAD_CHUNK_SIZE)
+
+    job = AK_Prod.submit_job(
+        fields.get('source_type', "YouTube video" if fields.get('youtube_url') else "Local file"),
+        fields.get('youtube_url', ''),
+        str(file_path) if file_path else None,
+        fields.get('language_sign', ''),
+        fields.get('target_language', ''),
+        subtitle_mode,
+        flag(fields.get('revise'), AK_Prod.REVISE_SUBTITLES),
+    )
+    if job is None:
+        return jsonify({'error': "Please provide the required inputs."}), 400
+    return jsonify(job_status(job)), 202, {'Location': url_for('status', job_id=job.id)}
+
+
+@app.get('/jobs/<job_id>')
+def status(job_id):
+    job = AK_Prod.job_engine.get(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(job_status(job))
+
+
+@app.get('/jobs/<job_id>/<kind>')
+def download_output(job_id, kind):
+    job = AK_Prod.job_engine.get(job_id)
+    if job is None or kind not in OUTPUTS:
+        abort(404)
+    if job.status != 'done':
+        return jsonify(job_status(job)), 409
+    path = output_path(job, kind)
+    if path is None:
+        abort(404)
+    # conditional=True answers Range requests, so players can seek and downloads can resume
+    return send_file(path.resolve(), as_attachment=request.args.get('download') == '1', download_name=path.name, conditional=True)
+
+
+@app.get('/stats')
+def stats():
+    return jsonify({'pools': AK_Prod.job_engine.stats(), 'rate_limits': AK_Prod.scheduler.stats(),
+                    'artifacts': AK_Prod.artifact_store.stats(), 'translation_memory': AK_Prod.translation_memory.stats(),
+                    'transcription': AK_Prod.transcription_router.stats(), 'whisper': AK_Prod.whisper_service.stats()})
+
+
+@app.get('/metrics')
+def prometheus_metrics():
+    return Response(metrics.registry.render(), content_type='text/plain; version=0.0.4')
+
+
+if __name__ == '__main__':
+    if AK_Prod.transcription_router.local_available:
+        # Loaded before the first job, so a spilled shard does not wait for it
+        AK_Prod.whisper_service.load()
+    app.run(host='0.0.0.0', port=int(os.getenv('JOB_API_PORT', '8000')), threaded=True)
@@ -0,0 +1,64 @@
+# Client of the job API (job_api.py), used by the Gradio and Streamlit front ends so they only submit and follow jobs
+
+import time
+from pathlib import Path
+
+import requests
+
+
+class JobClient:
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    # file is an open binary file (or a path), it is streamed to the API as the raw request body, a block at a time,
+    # so neither side holds the whole file in memory
+    # revise=None leaves the choice to the server (REVISE_SUBTITLES)
+    def submit(self, source_type, youtube_url, language_sign, target_language, subtitle_mode=None, file=None, filename=None, revise=None):
+        fields = {'source_type': source_type, 'youtube_url': youtube_url or '', 'language_sign': language_sign,
+                  'target_language': target_language or ''}
+        if subtitle_mode:
+            fields['subtitle_mode'] = subtitle_mode
+        if revise is not None:
+            fields['revise'] = '1' if revise else '0'
+        if isinstance(file, (str, Path)):
+            with open(file, 'rb') as infile:
+                return self.submit(source_type, youtube_url, language_sign, target_language, subtitle_mode,
+                                   infile, filename or Path(file).name, revise)
+        if file is not None:
+            fields['filename'] = filename or 'upload'
+            response = self.session.post(f'{self.base_url}/jobs', params=fields, data=file, timeout=self.timeout,
+                                         headers={'Content-Type': 'application/octet-stream'})
+        else:
+            response = self.session.post(f'{self.base_url}/jobs', data=fields, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()['job_id']
+
+    def status(self, job_id):
+        response = self.session.get(f'{self.base_url}/jobs/{job_id}', timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    # on_progress(progress, message) is called on every poll until the job is done or failed
+    def wait(self, job_id, on_progress=None, interval=1.0):
+        while True:
+            status = self.status(job_id)
+            if on_progress:
+                on_progress(status['progress'], status['message'] or status['status'])
+            if status['status'] in ('done', 'failed'):
+                return status
+            time.sleep(interval)
+
+    def url(self, job_id, kind):
+        return f'{self.base_url}/jobs/{job_id}/{kind}'
+
+    def download(self, job_id, kind, dest):
+        dest = Path(dest)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        with self.session.get(self.url(job_id, kind), stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            with open(dest, 'wb') as outfile:
+                for chunk in response.iter_content(1024 * 1024):
+                    outfile.write(chunk)
+        return dest
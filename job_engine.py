@@ -0,0 +1,128 @@
+# Staged job pipeline. Every kind of stage (network bound download/transcribe/translate, CPU bound ffmpeg) has its own
+# bounded pool, so while one job is in ffmpeg the network bound stages of the other jobs keep running, instead of one
+# worker carrying a whole job from the download to the merge.
+# ffmpeg runs as a subprocess, the threads of the 'ffmpeg' pool only wait for it, so that pool bounds the number of
+# encoders running at once.
+
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+
+# Raised by a step that cannot go on (no subtitles to translate or merge...), the job fails with its message and, unlike
+# an unexpected exception, without a traceback in the log
+class StageFailed(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, steps, state):
+        self.id = uuid.uuid4().hex
+        self.steps = list(steps)
+        self.state = state
+        self.status = 'queued'  # queued, running, done or failed
+        self.stage = None
+        self.progress = 0.0
+        self.message = ''
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.timings = []  # (stage, seconds waiting for a worker, seconds running)
+        self.done = threading.Event()
+
+    # Same call as gr.Progress, so the pipeline functions report to the job instead of a Gradio request
+    def update(self, value=None, desc=None, *args, **kwargs):
+        if value is not None:
+            self.progress = float(value)
+        if desc:
+            self.message = desc
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+    def finish(self, status, error=None):
+        self.status = status
+        self.error = error
+        self.finished = time.time()
+        if status == 'done':
+            self.progress = 1.0
+        self.done.set()
+
+
+class JobEngine:
+    # pools maps a pool name to its number of workers, retention_seconds is how long finished jobs stay queryable
+    def __init__(self, pools, retention_seconds=24 * 3600):
+        self.executors = {name: ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'{name}-stage')
+                          for name, workers in pools.items()}
+        self.workers = dict(pools)
+        self.queued = {name: 0 for name in pools}
+        self.running = {name: 0 for name in pools}
+        self.retention_seconds = retention_seconds
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    # steps is a list of (pool, fn), fn(job) runs in that pool and raises to end the job early, which then fails
+    def submit(self, steps, state):
+        job = Job(steps, state)
+        with self.lock:
+            self.prune()
+            self.jobs[job.id] = job
+        self.schedule(job, 0)
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def schedule(self, job, position):
+        if position == len(job.steps):
+            job.finish('done')
+            return
+        pool, fn = job.steps[position]
+        with self.lock:
+            self.queued[pool] += 1
+        self.executors[pool].submit(self.run, job, position, time.monotonic())
+
+    def run(self, job, position, queued_at):
+        pool, fn = job.steps[position]
+        started = time.monotonic()
+        with self.lock:
+            self.queued[pool] -= 1
+            self.running[pool] += 1
+        job.status = 'running'
+        job.stage = fn.__name__
+        try:
+            # The root span of the step, the pipeline functions add theirs under it in the job's trace
+            with metrics.span(fn.__name__, job_id=job.id):
+                fn(job)
+        except StageFailed as e:
+            job.finish('failed', f"{job.stage}: {e}")
+            return
+        except Exception as e:
+            traceback.print_exc()
+            job.finish('failed', f"{job.stage}: {e}")
+            return
+        finally:
+            job.timings.append((fn.__name__, started - queued_at, time.monotonic() - started))
+            with self.lock:
+                self.running[pool] -= 1
+        self.schedule(job, position + 1)
+
+    def prune(self):
+        cutoff = time.time() - self.retention_seconds
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.finished and job.finished < cutoff]:
+            del self.jobs[job_id]
+
+    def stats(self):
+        with self.lock:
+            return {name: {'workers': self.workers[name], 'running': self.running[name], 'queued': self.queued[name]}
+                    for name in self.workers}
+
+    def shutdown(self):
+        for executor in self.executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
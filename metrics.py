@@ -0,0 +1,232 @@
+# Timing spans of the pipeline. A span covers one stage of a job (the job engine opens one per step, the pipeline
+# functions one each inside it) and records its wall time, the CPU time and disk I/O of the ffmpeg/yt-dlp processes it
+# ran, the size of its output file and the API calls and tokens it used. The counts of a span also go to the spans
+# around it. Finished spans are aggregated for the Prometheus endpoint (render()) and appended to the JSONL trace of
+# their job, TRACE_DIR/<job id>.jsonl.
+
+import contextvars
+import functools
+import json
+import os
+import subprocess
+import threading
+import time
+import traceback
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+TRACE_DIR = Path(os.getenv('TRACE_DIR', 'traces'))
+SECONDS_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+_current = contextvars.ContextVar('span', default=None)
+
+
+class Span:
+    def __init__(self, name, job_id=None, parent=None):
+        self.name = name
+        self.parent = parent
+        self.job_id = job_id or (parent.job_id if parent else None)
+        self.started = time.time()
+        self.started_monotonic = time.monotonic()
+        self.seconds = None
+        self.status = 'ok'
+        self.error = None
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+    def add(self, **counts):
+        span = self
+        while span:
+            with span.lock:
+                span.counts.update(counts)
+            span = span.parent
+
+    def record(self):
+        return {'job': self.job_id, 'span': self.name, 'parent': self.parent.name if self.parent else None,
+                'start': round(self.started, 3), 'seconds': round(self.seconds, 3), 'status': self.status,
+                'error': self.error, 'counts': {name: round(value, 3) for name, value in sorted(self.counts.items())}}
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.spans = Counter()  # (name, status) -> finished spans
+        self.seconds = Counter()  # name -> total seconds
+        self.buckets = defaultdict(Counter)  # name -> bucket -> spans at most that long
+        self.counts = defaultdict(Counter)  # name -> count -> total
+
+    def observe(self, span):
+        with self.lock:
+            self.spans[span.name, span.status] += 1
+            self.seconds[span.name] += span.seconds
+            for bucket in SECONDS_BUCKETS:
+                if span.seconds <= bucket:
+                    self.buckets[span.name][bucket] += 1
+            self.counts[span.name].update(span.counts)
+
+    # Text exposition format of Prometheus
+    def render(self):
+        lines = ['# TYPE anakolchi_span_seconds histogram']
+        with self.lock:
+            names = sorted(self.seconds)
+            for name in names:
+                total = sum(count for (span_name, _), count in self.spans.items() if span_name == name)
+                for bucket in SECONDS_BUCKETS:
+                    lines.append(f'anakolchi_span_seconds_bucket{{span="{name}",le="{bucket}"}} {self.buckets[name][bucket]}')
+                lines.append(f'anakolchi_span_seconds_bucket{{span="{name}",le="+Inf"}} {total}')
+                lines.append(f'anakolchi_span_seconds_sum{{span="{name}"}} {self.seconds[name]:.3f}')
+                lines.append(f'anakolchi_span_seconds_count{{span="{name}"}} {total}')
+            lines.append('# TYPE anakolchi_spans_total counter')
+            for (name, status), count in sorted(self.spans.items()):
+                lines.append(f'anakolchi_spans_total{{span="{name}",status="{status}"}} {count}')
+            for count_name in sorted({count_name for counts in self.counts.values() for count_name in counts}):
+                lines.append(f'# TYPE anakolchi_{count_name}_total counter')
+                for name in names:
+                    if count_name in self.counts[name]:
+                        lines.append(f'anakolchi_{count_name}_total{{span="{name}"}} {self.counts[name][count_name]:.3f}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+_trace_lock = threading.Lock()
+
+
+def trace_path(job_id):
+    return TRACE_DIR / f'{job_id}.jsonl'
+
+
+def write_trace(span):
+    if not span.job_id:
+        return
+    line = json.dumps(span.record()) + '\n'
+    with _trace_lock:
+        TRACE_DIR.mkdir(parents=True, exist_ok=True)
+        with open(trace_path(span.job_id), 'a', encoding='utf-8') as outfile:
+            outfile.write(line)
+
+
+@contextmanager
+def span(name, job_id=None):
+    current = Span(name, job_id, _current.get())
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.status = 'error'
+        current.error = ''.join(traceback.format_exception_only(type(e), e)).strip()
+        raise
+    finally:
+        _current.reset(token)
+        current.seconds = time.monotonic() - current.started_monotonic
+        registry.observe(current)
+        write_trace(current)
+
+
+# Decorator for the pipeline functions, a returned path that exists counts as the output of the span
+def traced(name):
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name) as current:
+                result = fn(*args, **kwargs)
+                if isinstance(result, Path) and result.is_file():
+                    current.add(output_bytes=result.stat().st_size)
+                return result
+        return wrapper
+    return decorate
+
+
+# Adds to the current span (and the spans around it), does nothing outside of a span
+def add(**counts):
+    current = _current.get()
+    if current:
+        current.add(**counts)
+
+
+# fn runs in the span of the caller when it is called from another thread (e.g. an executor worker)
+def bind(fn):
+    context = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+    return wrapper
+
+
+# Waits for a Popen with os.wait4, which also gives the resource usage of the process, and sets its returncode so
+# Popen's own wait() and poll() return at once. The usage is None where there is no wait4 (Windows), Popen waits then.
+def reap(process):
+    if process.returncode is not None or not hasattr(os, 'wait4'):
+        process.wait()
+        return None
+    _, status, usage = os.wait4(process.pid, 0)
+    # Same convention as Popen.returncode, minus the signal number for a killed process
+    process.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+    return usage
+
+
+# Whether the process has exited, without reaping it (unlike Popen.poll) so reap() still gets its usage
+def exited(process):
+    if process.returncode is not None:
+        return True
+    if not hasattr(os, 'waitid'):
+        return process.poll() is not None
+    return os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOHANG | os.WNOWAIT) is not None
+
+
+# Counts a process in the current span, with the CPU seconds and the bytes read from and written to disk of its usage
+def record_process(usage):
+    if usage is None:
+        add(processes=1)
+        return
+    add(processes=1, child_cpu_seconds=usage.ru_utime + usage.ru_stime,
+        child_bytes_read=usage.ru_inblock * 512, child_bytes_written=usage.ru_oublock * 512)
+
+
+# Drains stdout and stderr at once (stderr on a thread) like Popen.communicate, which cannot be used as it reaps
+def read_outputs(process):
+    stderr = {}
+    reader = threading.Thread(target=lambda: stderr.update(data=process.stderr.read())) if process.stderr else None
+    if reader:
+        reader.start()
+    stdout = process.stdout.read() if process.stdout else None
+    if reader:
+        reader.join()
+    return stdout, stderr.get('data')
+
+
+# subprocess.run for the ffmpeg/yt-dlp commands, with the process counted in the current span
+def run(command, check=False, capture_output=False, **kwargs):
+    if capture_output:
+        kwargs['stdout'] = kwargs['stderr'] = subprocess.PIPE
+    with subprocess.Popen(command, **kwargs) as process:
+        stdout, stderr = read_outputs(process)
+        record_process(reap(process))
+    if check and process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command, stdout, stderr)
+    return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        body = registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+# /metrics on its own port, for the apps that do not run the job API (the Gradio app)
+def serve(port):
+    server = ThreadingHTTPServer(('0.0.0.0', port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,178 @@
+# Process wide scheduler for the Wit.ai and Anthropic calls. Every key (one per Wit.ai token, one for Anthropic)
+# gets a token bucket and an adaptive (AIMD) concurrency limit, and requests from different jobs are queued fairly
+# (round robin between jobs) instead of failing or retrying blindly when one job gets throttled.
+
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+
+class KeyLimiter:
+    def __init__(self, name, rate, capacity, max_concurrency, min_concurrency=1, backoff_seconds=5.0):
+        self.name = name
+        self.base_rate = rate  # tokens per second
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency = float(max_concurrency)
+        self.backoff_seconds = backoff_seconds
+        self.backoff_until = 0.0
+        self.in_flight = 0
+        self.queues = OrderedDict()  # owner -> deque of waiting tickets
+        self.queued_cost = 0
+        self.cond = threading.Condition()
+        self.granted = 0
+        self.throttled = 0
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def queue_depth(self):
+        return sum(len(tickets) for tickets in self.queues.values())
+
+    def is_next(self, owner, ticket):
+        first_owner = next(iter(self.queues))
+        return first_owner == owner and self.queues[owner][0] is ticket
+
+    # A request costing more than the bucket can hold is let through once the bucket is full and leaves it in debt,
+    # so long Wit.ai shards still wait for the equivalent number of single calls
+    def acquire(self, cost=1, owner=None):
+        ticket = object()
+        with self.cond:
+            self.queues.setdefault(owner, deque()).append(ticket)
+            self.queued_cost += cost
+            while True:
+                now = time.monotonic()
+                self.refill(now)
+                wait = None
+                if self.is_next(owner, ticket):
+                    if now < self.backoff_until:
+                        wait = self.backoff_until - now
+                    elif self.in_flight < int(self.concurrency):
+                        needed = min(cost, self.capacity)
+                        if self.tokens >= needed:
+                            self.tokens -= cost
+                            self.queued_cost -= cost
+                            self.in_flight += 1
+                            self.granted += 1
+                            tickets = self.queues.pop(owner)
+                            tickets.popleft()
+                            if tickets:
+                                # Round robin: the owner goes back to the end of the line for its next request
+                                self.queues[owner] = tickets
+                            self.cond.notify_all()
+                            return
+                        wait = (needed - self.tokens) / self.rate
+                self.cond.wait(timeout=wait)
+
+    # Additive increase on success, multiplicative decrease (and a pause) when the key was throttled
+    def release(self, throttled=False, retry_after=None):
+        with self.cond:
+            self.in_flight -= 1
+            if throttled:
+                self.throttled += 1
+                self.concurrency = max(self.min_concurrency, self.concurrency / 2)
+                self.rate = max(self.base_rate / 16, self.rate / 2)
+                self.backoff_until = time.monotonic() + (retry_after or self.backoff_seconds)
+            else:
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1 / max(self.concurrency, 1))
+                self.rate = min(self.base_rate, self.rate + self.base_rate / 20)
+            self.cond.notify_all()
+
+    # Seconds a new request of this cost would wait for the backoff and the bucket, behind the requests already queued
+    def estimated_wait(self, cost=1):
+        with self.cond:
+            now = time.monotonic()
+            self.refill(now)
+            return max(0.0, self.backoff_until - now) + max(0.0, self.queued_cost + cost - self.tokens) / self.rate
+
+    def stats(self):
+        with self.cond:
+            self.refill(time.monotonic())
+            return {
+                'queue_depth': self.queue_depth(),
+                'in_flight': self.in_flight,
+                'concurrency_limit': int(self.concurrency),
+                'rate_per_minute': round(self.rate * 60, 1),
+                'tokens': round(self.tokens, 1),
+                'granted': self.granted,
+                'throttled': self.throttled,
+                'backoff_seconds': round(max(0.0, self.backoff_until - time.monotonic()), 1),
+            }
+
+
+class Slot:
+    def __init__(self):
+        self.throttled = False
+        self.retry_after = None
+
+    def throttle(self, retry_after=None):
+        self.throttled = True
+        self.retry_after = retry_after
+
+
+class RateLimitScheduler:
+    def __init__(self):
+        self.limiters = {}
+        self.defaults = {}
+        self.lock = threading.Lock()
+
+    # Keys starting with prefix (e.g. 'wit:' for every Wit.ai token) get these settings when first used
+    def configure(self, prefix, requests_per_minute, burst, max_concurrency, min_concurrency=1):
+        self.defaults[prefix] = dict(
+            rate=requests_per_minute / 60.0, capacity=burst, max_concurrency=max_concurrency, min_concurrency=min_concurrency,
+        )
+
+    def limiter(self, key):
+        with self.lock:
+            if key not in self.limiters:
+                prefix = max((prefix for prefix in self.defaults if key.startswith(prefix)), key=len, default=None)
+                settings = self.defaults.get(prefix, dict(rate=1.0, capacity=1, max_concurrency=1))
+                self.limiters[key] = KeyLimiter(key, **settings)
+            return self.limiters[key]
+
+    # The key with the fewest queued and running requests, used to spread work over a token pool
+    def least_loaded(self, keys):
+        def load(key):
+            limiter = self.limiter(key)
+            with limiter.cond:
+                return limiter.queue_depth() + limiter.in_flight
+        return min(keys, key=load)
+
+    def estimated_wait(self, key, cost=1):
+        return self.limiter(key).estimated_wait(cost)
+
+    @contextmanager
+    def slot(self, key, cost=1, owner=None):
+        limiter = self.limiter(key)
+        limiter.acquire(cost, owner)
+        slot = Slot()
+        try:
+            yield slot
+        finally:
+            limiter.release(slot.throttled, slot.retry_after)
+            if slot.throttled:
+                print(f"Rate limited on {key}, backing off: {limiter.stats()}")
+
+    # Runs fn in a slot, a throttled call goes back into the queue instead of being retried right away.
+    # throttle_info(exception) returns None when the exception is not a throttle, else the retry-after seconds (or 0).
+    def call(self, key, fn, throttle_info, cost=1, owner=None, attempts=5):
+        for attempt in range(attempts):
+            with self.slot(key, cost, owner) as slot:
+                try:
+                    return fn()
+                except Exception as e:
+                    retry_after = throttle_info(e)
+                    if retry_after is None or attempt == attempts - 1:
+                        raise
+                    slot.throttle(retry_after or None)
+
+    def stats(self):
+        with self.lock:
+            limiters = dict(self.limiters)
+        return {key: limiter.stats() for key, limiter in limiters.items()}
@@ -0,0 +1,132 @@
+# Local pre-pass of the revision: flags the cues that probably need fixing so only those (with a few neighbouring
+# cues as context) are sent to Claude, the clean ones are kept as they are. A cue is flagged for
+#   oov      a word missing from the vocabulary (the word list when there is one, plus the words frequent in the file),
+#            without a word list only the rare words that look like a misspelling of a frequent one
+#   charset  letters of several scripts in one word, replacement or control characters, a letter repeated many times
+#   speaker  a "Name:" label that is a variant of a more frequent label
+#   garbled  almost no letters, mostly symbols, a word looping, or more text than can be read in the cue's time
+
+import difflib
+import re
+import unicodedata
+from collections import Counter
+
+from token_budget import char_script
+
+WORD = re.compile(r"[^\W\d_]+(?:['’][^\W\d_]+)*")
+SPEAKER_LABEL = re.compile(r"^\s*[-–]?\s*([^\W\d_][^\W\d_ .'-]*(?:[ .'-][^\W\d_]+){0,2})\s*:")
+REPEATED_LETTER = re.compile(r'([^\W\d_])\1{3,}')
+LOOPING_WORD = re.compile(r'\b(\w+)(?:\W+\1\b){2,}', re.IGNORECASE)
+
+
+def load_wordlist(path):
+    with open(path, 'r', encoding='utf-8', errors='ignore') as infile:
+        return {line.strip().casefold() for line in infile if line.strip()}
+
+
+def cue_words(text):
+    return [word.casefold() for word in WORD.findall(text)]
+
+
+def charset_anomaly(text):
+    if '\ufffd' in text or any(unicodedata.category(char) == 'Cc' for char in text if char != '\n'):
+        return True
+    if REPEATED_LETTER.search(text):
+        return True
+    for word in WORD.findall(text):
+        if len({script for script in map(char_script, word) if script}) > 1:
+            return True
+    return False
+
+
+def garbled(cue, max_chars_per_second):
+    text = cue.text
+    letters = sum(1 for char in text if char.isalpha())
+    symbols = sum(1 for char in text if not char.isalnum() and not char.isspace())
+    if letters < 2 or symbols > 0.4 * len(text.replace(' ', '').replace('\n', '')):
+        return True
+    if LOOPING_WORD.search(text):
+        return True
+    duration = cue.end - cue.start
+    return duration > 0 and len(text) / duration > max_chars_per_second
+
+
+def speaker_labels(text):
+    return [match.group(1).strip() for match in map(SPEAKER_LABEL.match, text.split('\n')) if match]
+
+
+# The labels that are spelled differently from a more frequent label close to them (case, a letter or two)
+def inconsistent_labels(counts, cutoff):
+    canonical = {}
+    ranked = [label for label, _ in counts.most_common()]
+    for position, label in enumerate(ranked):
+        for other in ranked[:position]:
+            if other.casefold() == label.casefold() or difflib.SequenceMatcher(None, other.casefold(), label.casefold()).ratio() >= cutoff:
+                canonical[label] = other
+                break
+    return canonical
+
+
+class RevisionGate:
+    def __init__(self, wordlist=None, frequent_count=3, min_word_length=3, similarity=0.8, max_chars_per_second=30.0):
+        self.wordlist = wordlist or set()
+        self.frequent_count = frequent_count
+        self.min_word_length = min_word_length
+        self.similarity = similarity
+        self.max_chars_per_second = max_chars_per_second
+
+    # Words of the file that are not in the vocabulary and are worth a revision
+    def suspicious_words(self, counts):
+        frequent = [word for word, count in counts.items() if count >= self.frequent_count]
+        by_length = {}
+        for word in frequent:
+            by_length.setdefault(len(word), []).append(word)
+        suspicious = set()
+        for word, count in counts.items():
+            if len(word) < self.min_word_length or word in self.wordlist or count >= self.frequent_count:
+                continue
+            if self.wordlist and count == 1:
+                suspicious.add(word)
+                continue
+            # Only the frequent words of about the same length can be what the rare word was meant to be
+            candidates = [other for size in range(len(word) - 2, len(word) + 3) for other in by_length.get(size, ())]
+            if difflib.get_close_matches(word, candidates, n=1, cutoff=self.similarity):
+                suspicious.add(word)
+        return suspicious
+
+    # {cue index: [reasons]} for the cues that need a revision
+    def flag(self, cues):
+        words = {cue.index: cue_words(cue.text) for cue in cues}
+        suspicious = self.suspicious_words(Counter(word for word_list in words.values() for word in word_list))
+        labels = {cue.index: speaker_labels(cue.text) for cue in cues}
+        variants = inconsistent_labels(Counter(label for cue_labels in labels.values() for label in cue_labels), self.similarity)
+
+        flagged = {}
+        for cue in cues:
+            if not cue.text:
+                continue
+            reasons = []
+            if any(word in suspicious for word in words[cue.index]):
+                reasons.append('oov')
+            if charset_anomaly(cue.text):
+                reasons.append('charset')
+            if any(label in variants for label in labels[cue.index]):
+                reasons.append('speaker')
+            if garbled(cue, self.max_chars_per_second):
+                reasons.append('garbled')
+            if reasons:
+                flagged[cue.index] = reasons
+        return flagged
+
+
+# The cues around each batch, given to Claude as context only
+def context_cues(cues, batch, size):
+    if not size:
+        return []
+    positions = {cue.index: position for position, cue in enumerate(cues)}
+    in_batch = {cue.index for cue in batch}
+    around = set()
+    for cue in batch:
+        position = positions[cue.index]
+        around.update(range(max(0, position - size), min(len(cues), position + size + 1)))
+    return [cues[position] for position in sorted(around) if cues[position].index not in in_batch and cues[position].text]
@@ -0,0 +1,163 @@
+# In-memory model of an SRT file shared by every stage. A cue keeps its times as seconds, the file is parsed and
+# written in one pass over its text, and the parsed cues of a file are kept while it does not change so the stages
+# (transcription, translation, slicing for the burn-in) do not parse the same file again.
+
+import os
+import re
+import threading
+from collections import OrderedDict
+
+
+# Cues are not modified once built, a stage that moves the times makes new ones
+class Cue:
+    __slots__ = ('index', 'start', 'end', 'text', '_timestamp')
+
+    # start and end may be None when the timestamp line is given, they are read from it on first use
+    def __init__(self, index, start, end, text, timestamp=None):
+        self.index = index
+        if start is not None:
+            self.start = start
+            self.end = end
+        self.text = text
+        self._timestamp = timestamp
+
+    # Only called while start and end are unset, once set they are plain slots
+    def __getattr__(self, name):
+        if name in ('start', 'end'):
+            self.start, self.end = parse_timestamp(self._timestamp)
+            return getattr(self, name)
+        raise AttributeError(name)
+
+    # Formatted on first use, a cue read from a well formed file keeps its timestamp line as it was
+    @property
+    def timestamp(self):
+        if self._timestamp is None:
+            self._timestamp = f"{format_time(self.start)} --> {format_time(self.end)}"
+        return self._timestamp
+
+    def __repr__(self):
+        return f"Cue({self.index}, {self.start:.3f}, {self.end:.3f}, {self.text!r})"
+
+
+def parse_time(value):
+    value = value.strip()
+    # The usual HH:MM:SS,mmm is read by position, anything else (dots, missing hours) by splitting
+    if len(value) == 12 and value[2] == ':' and value[5] == ':':
+        return int(value[0:2]) * 3600 + int(value[3:5]) * 60 + int(value[6:8]) + int(value[9:12]) / 1000
+    parts = value.replace(',', '.').split(':')
+    seconds = float(parts[-1])
+    for position, part in enumerate(reversed(parts[:-1]), 1):
+        seconds += int(part) * 60 ** position
+    return seconds
+
+
+def format_time(seconds):
+    milliseconds = int(seconds * 1000 + 0.5) if seconds > 0 else 0
+    return '%02d:%02d:%02d,%03d' % (milliseconds // 3600000, milliseconds // 60000 % 60, milliseconds // 1000 % 60, milliseconds % 1000)
+
+
+TIME_LINE = re.compile(r'\s*(\d+):(\d\d):(\d\d)[,.](\d{3})\s*-->\s*(\d+):(\d\d):(\d\d)[,.](\d{3})')
+# The timestamp line as format_time writes it, kept as it is and only parsed when the times are used
+STANDARD_TIME_LINE = re.compile(r'\d\d:\d\d:\d\d,\d\d\d --> \d\d:\d\d:\d\d,\d\d\d')
+# Cues are separated by blank lines, or lines of whitespace
+BLOCK_SEPARATOR = re.compile(r'\n\s*\n')
+
+
+def parse_timestamp(line):
+    match = TIME_LINE.match(line)
+    if match:
+        h1, m1, s1, ms1, h2, m2, s2, ms2 = map(int, match.groups())
+        return h1 * 3600 + m1 * 60 + s1 + ms1 / 1000, h2 * 3600 + m2 * 60 + s2 + ms2 / 1000
+    start, end = line.split('-->', 1)
+    # Position tags after the end time (e.g. "X1:...") are dropped
+    return parse_time(start), parse_time(end.split()[0])
+
+
+# The cue of one block of lines: the first line with '-->' is the timestamp, the lines after it the text
+def parse_block(block, index):
+    arrow = block.find('-->')
+    if arrow < 0:
+        return None
+    line_end = block.find('\n', arrow)
+    if line_end < 0:
+        line_end = len(block)
+    line = block[block.rfind('\n', 0, arrow) + 1:line_end].rstrip()
+    text = block[line_end + 1:].strip()
+    if STANDARD_TIME_LINE.fullmatch(line):
+        return Cue(index, None, None, text, line)
+    start, end = parse_timestamp(line)
+    return Cue(index, start, end, text)
+
+
+# Yields the cues of the text of an SRT file one at a time, numbered from 1 in file order
+def iter_srt(content):
+    index = 1
+    for block in BLOCK_SEPARATOR.split(content.lstrip('\ufeff')):
+        # The usual block (number, timestamp line as format_time writes it, text) is taken apart with one split and a
+        # look at the separators of the timestamp, its digits are only read with the times. parse_block for the rest.
+        parts = block.split('\n', 2)
+        if len(parts) == 3:
+            number, line, text = parts
+            if len(line) == 29 and line[12:17] == ' --> ' and line[8] == ',' and line[25] == ',' and '-->' not in number:
+                yield Cue(index, None, None, text.strip(), line)
+                index += 1
+                continue
+        cue = parse_block(block, index)
+        if cue is not None:
+            yield cue
+            index += 1
+
+
+def format_cue(cue, text=None):
+    return f"{cue.index}\n{cue.timestamp}\n{cue.text if text is None else text}\n\n"
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+CACHE_FILES = 32
+
+
+def _cache_key(srt_path):
+    stat = os.stat(srt_path)
+    return os.path.realpath(srt_path), stat.st_mtime_ns, stat.st_size
+
+
+def remember(srt_path, cues):
+    with _cache_lock:
+        _cache[_cache_key(srt_path)] = cues
+        while len(_cache) > CACHE_FILES:
+            _cache.popitem(last=False)
+
+
+# The cues of a file, parsed once per version of the file. The list is shared, callers must not modify it.
+def read_srt(srt_path):
+    key = _cache_key(srt_path)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    with open(srt_path, 'r', encoding='utf-8') as infile:
+        cues = list(iter_srt(infile.read()))
+    remember(srt_path, cues)
+    return cues
+
+
+def write_srt(srt_path, cues):
+    cues = list(cues)
+    with open(srt_path, 'w', encoding='utf-8') as outfile:
+        # Formatted inline and written at once, the timestamp property is only called for the cues without their line
+        outfile.write(''.join([f"{cue.index}\n{cue._timestamp or cue.timestamp}\n{cue.text}\n\n" for cue in cues]))
+    remember(srt_path, cues)
+
+
+def word_count(cues):
+    return sum(len(cue.text.split()) for cue in cues)
+
+
+# The cues overlapping [start, end), clipped to it, with times relative to start
+def slice_cues(cues, start, end):
+    sliced = []
+    for cue in cues:
+        if cue.end > start and cue.start < end:
+            sliced.append(Cue(len(sliced) + 1, max(cue.start, start) - start, min(cue.end, end) - start, cue.text))
+    return sliced
@@ -0,0 +1,61 @@
+# Regression tests of the artifact store
+#   python -m unittest discover tests
+
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from artifact_cache import ArtifactStore, run_cached_stage
+
+
+# A compute that writes its output (and the .txt next to it) in place like open(..., 'w') and ffmpeg -y do
+def write_in_place(output_path, text):
+    def compute():
+        output_path.write_text(text)
+        output_path.with_suffix('.txt').write_text(text + ' txt')
+        return output_path
+    return compute
+
+
+class RunCachedStageTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.store = ArtifactStore(self.root / 'artifacts')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_stage(self, source, params, output_path, text):
+        return run_cached_stage(self.store, 'merge', source, params, output_path, write_in_place(output_path, text),
+                                extra_suffixes=['.txt'])
+
+    # The same working path for two keys (merge of the French and of the German SRT of one video): computing the second
+    # must not rewrite the stored artifact of the first
+    def test_compute_does_not_rewrite_the_artifact_of_another_key(self):
+        output_path = self.root / 'video_with_subs.srt'
+        self.run_stage('video', {'srt': 'fr'}, output_path, 'french')
+        self.run_stage('video', {'srt': 'de'}, output_path, 'german')
+        self.assertEqual(output_path.read_text(), 'german')
+
+        fetched, _ = self.run_stage('video', {'srt': 'fr'}, output_path, 'recomputed')
+        self.assertEqual(fetched.read_text(), 'french')
+        self.assertEqual(fetched.with_suffix('.txt').read_text(), 'french txt')
+        self.assertEqual(self.store.stats(), {'hits': 1, 'misses': 2})
+
+    # An uncached compute (source of None) writes over a fetched working file the same way
+    def test_uncached_compute_does_not_rewrite_a_fetched_artifact(self):
+        output_path = self.root / 'video_with_subs.srt'
+        self.run_stage('video', {'srt': 'fr'}, output_path, 'french')
+        self.run_stage('video', {'srt': 'fr'}, output_path, 'recomputed')
+        self.run_stage(None, {'srt': None}, output_path, 'incomplete')
+
+        fetched, _ = self.run_stage('video', {'srt': 'fr'}, output_path, 'recomputed')
+        self.assertEqual(fetched.read_text(), 'french')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+# Token budgets of the Claude calls. The input size of a batch is estimated from its characters with a
+# characters-per-token ratio calibrated once per script against the count_tokens endpoint, and the output budget is
+# that size times the expansion factor (output tokens / input tokens) learned from the past jobs of the same task and
+# target language. Both are kept in SQLite next to the translation memory, so they survive restarts.
+
+import math
+import sqlite3
+import threading
+
+# Until calibrated, roughly what the Claude tokenizer gives for each script
+DEFAULT_CHARS_PER_TOKEN = {'latin': 3.5, 'cyrillic': 2.5, 'arabic': 2.2, 'cjk': 1.1}
+DEFAULT_EXPANSION = {'translate': 1.6, 'revise': 1.15, 'revise_translate': 2.8}
+
+
+# Script of one character, None for the characters that do not count (digits, punctuation, other scripts)
+def char_script(char):
+    code = ord(char)
+    if code < 0x0250:
+        return 'latin' if char.isalpha() else None
+    if 0x0400 <= code < 0x0530:
+        return 'cyrillic'
+    if 0x0600 <= code < 0x0780 or 0x08A0 <= code < 0x0900 or 0xFB50 <= code < 0xFE00 or 0xFE70 <= code < 0xFF00:
+        return 'arabic'
+    if 0x3040 <= code < 0x3100 or 0x4E00 <= code < 0xA000 or 0xAC00 <= code < 0xD7B0:
+        return 'cjk'
+    return None
+
+
+def text_script(text):
+    counts = {'latin': 0, 'cyrillic': 0, 'arabic': 0, 'cjk': 0}
+    for char in text:
+        script = char_script(char)
+        if script:
+            counts[script] += 1
+    return max(counts, key=counts.get)
+
+
+class TokenBudget:
+    def __init__(self, db_path, safety=1.2, tokens_per_cue=4, learning_rate=0.2):
+        self.safety = safety
+        self.tokens_per_cue = tokens_per_cue  # the "#<index>" line and the blank line around each cue
+        self.learning_rate = learning_rate
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS token_stats (key TEXT PRIMARY KEY, value REAL, samples INTEGER)')
+        self.conn.commit()
+        self.values = {key: (value, samples) for key, value, samples in self.conn.execute('SELECT key, value, samples FROM token_stats')}
+        self.truncations = 0
+        self.calibrations = 0
+
+    def save(self, key, value, samples):
+        self.values[key] = (value, samples)
+        self.conn.execute('INSERT OR REPLACE INTO token_stats VALUES (?, ?, ?)', (key, value, samples))
+        self.conn.commit()
+
+    def chars_per_token(self, script):
+        value, _ = self.values.get(f'chars_per_token:{script}', (DEFAULT_CHARS_PER_TOKEN[script], 0))
+        return value
+
+    # count_fn(text) returns the exact token count of text, it is only called for scripts not calibrated yet
+    def calibrate(self, texts, count_fn, sample_chars=4000):
+        sample = ''
+        for text in texts:
+            if len(sample) >= sample_chars:
+                break
+            sample += text + '\n'
+        if not sample.strip():
+            return
+        script = text_script(sample)
+        with self.lock:
+            if f'chars_per_token:{script}' in self.values:
+                return
+        tokens = count_fn(sample)
+        if tokens:
+            with self.lock:
+                self.calibrations += 1
+                self.save(f'chars_per_token:{script}', len(sample) / tokens, tokens)
+            print(f"Calibrated {script} text at {len(sample) / tokens:.2f} characters per token")
+
+    def estimate(self, text):
+        return math.ceil(len(text) / self.chars_per_token(text_script(text))) if text else 0
+
+    def expansion(self, task, target):
+        value, _ = self.values.get(f'expansion:{task}:{target}', (DEFAULT_EXPANSION.get(task, 1.6), 0))
+        return value
+
+    def output_budget(self, task, target, input_tokens, cue_count):
+        return math.ceil(input_tokens * self.expansion(task, target) * self.safety) + self.tokens_per_cue * cue_count + 64
+
+    # Exponential moving average of the observed output/input ratio. A truncated response only gives a lower bound,
+    # the factor is raised past it so the retry gets more room.
+    def learn(self, task, target, input_tokens, output_tokens, truncated=False):
+        if not input_tokens:
+            return
+        key = f'expansion:{task}:{target}'
+        observed = output_tokens / input_tokens
+        with self.lock:
+            current, samples = self.values.get(key, (DEFAULT_EXPANSION.get(task, 1.6), 0))
+            if truncated:
+                self.truncations += 1
+                value = max(current, observed) * 1.25
+            elif samples == 0:
+                value = observed
+            else:
+                value = current + self.learning_rate * (observed - current)
+            self.save(key, value, samples + 1)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'truncations': self.truncations,
+                'calibrations': self.calibrations,
+                'chars_per_token': {key.split(':', 1)[1]: round(value, 2) for key, (value, _) in self.values.items() if key.startswith('chars_per_token:')},
+                'expansion': {key.split(':', 1)[1]: round(value, 2) for key, (value, _) in self.values.items() if key.startswith('expansion:')},
+            }
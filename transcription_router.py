@@ -0,0 +1,70 @@
+# Picks the backend of every transcription shard. Wit.ai is used while its tokens keep up, a shard goes to the resident
+# whisper model (whisper_service.py) when its language has no Wit.ai token or when it would be done sooner locally:
+# the Wit.ai estimate is the wait of the least loaded token (bucket, queue, backoff) plus the calls of the shard, the
+# local one is the audio already routed to whisper plus the shard, at the measured speed of the workers.
+#   TRANSCRIBE_BACKEND=auto     route by those estimates (Wit.ai only when faster-whisper is not installed)
+#   TRANSCRIBE_BACKEND=wit      always Wit.ai
+#   TRANSCRIBE_BACKEND=whisper  always the local model
+
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from whisper_service import whisper_installed
+
+
+class TranscriptionRouter:
+    def __init__(self, scheduler, whisper_service, mode='auto', wit_seconds_per_call=1.5, local_speed=2.0, spill_margin=1.25):
+        self.scheduler = scheduler
+        self.whisper_service = whisper_service
+        self.mode = mode
+        self.wit_seconds_per_call = wit_seconds_per_call
+        # Seconds of audio a whisper worker transcribes per second until it has been measured
+        self.local_speed = local_speed
+        # Wit.ai keeps the shard unless the local estimate is this many times shorter, the two do not transcribe alike
+        self.spill_margin = spill_margin
+        self.local_available = mode != 'wit' and whisper_installed()
+        if mode == 'whisper' and not self.local_available:
+            print("TRANSCRIBE_BACKEND=whisper but faster-whisper is not installed, using Wit.ai")
+        self.lock = threading.Lock()
+        self.local_pending_seconds = 0.0
+        self.routed = Counter()
+
+    def wit_estimate(self, wit_keys, calls):
+        key = self.scheduler.least_loaded(wit_keys)
+        return self.scheduler.estimated_wait(key, calls) + calls * self.wit_seconds_per_call
+
+    def local_estimate(self, seconds):
+        speed = self.whisper_service.stats()['speed'] or self.local_speed
+        with self.lock:
+            pending = self.local_pending_seconds
+        return (pending + seconds) / (speed * self.whisper_service.workers)
+
+    # 'wit' or 'whisper' for a shard of seconds of audio taking calls Wit.ai calls, wit_keys are the limiter keys of the
+    # Wit.ai tokens of its language
+    def choose(self, wit_keys, seconds, calls):
+        if not self.local_available:
+            backend = 'wit'
+        elif self.mode == 'whisper' or not wit_keys:
+            backend = 'whisper'
+        else:
+            backend = 'whisper' if self.local_estimate(seconds) * self.spill_margin < self.wit_estimate(wit_keys, calls) else 'wit'
+        with self.lock:
+            self.routed[backend] += 1
+        return backend
+
+    # Held while a shard is transcribed locally, so the next estimates count it
+    @contextmanager
+    def local(self, seconds):
+        with self.lock:
+            self.local_pending_seconds += seconds
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.local_pending_seconds -= seconds
+
+    def stats(self):
+        with self.lock:
+            return {'mode': self.mode, 'local_available': self.local_available, 'routed': dict(self.routed),
+                    'local_pending_seconds': round(self.local_pending_seconds, 1)}
@@ -0,0 +1,97 @@
+# Local translation memory so recurring cues (intros, outros, catch phrases) are only paid for once
+
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+
+def normalize_cue_text(text):
+    text = unicodedata.normalize('NFC', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+class TranslationMemory:
+    def __init__(self, db_path='translation_memory.sqlite3', max_entries=200000):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS memory ('
+            'key TEXT PRIMARY KEY, model TEXT, task TEXT, target TEXT, source TEXT, result TEXT, '
+            'tokens REAL, seconds REAL, last_used REAL)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS memory_last_used ON memory (last_used)')
+        self.conn.commit()
+        self.hits = 0
+        self.misses = 0
+        self.saved_tokens = 0.0
+        self.saved_seconds = 0.0
+
+    def make_key(self, model, task, target, text):
+        raw = '\0'.join([model, task, target, normalize_cue_text(text)])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    # Results keyed by the normalized text, so every spelling of a cue that maps to the same entry finds it
+    def get_many(self, model, task, target, texts):
+        keys = {self.make_key(model, task, target, text): normalize_cue_text(text) for text in texts if text}
+        found = {}
+        with self.lock:
+            key_list = list(keys)
+            # Stay under SQLite's limit on bound parameters
+            for i in range(0, len(key_list), 500):
+                chunk = key_list[i:i + 500]
+                rows = self.conn.execute(
+                    f"SELECT key, result, tokens, seconds FROM memory WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for key, result, tokens, seconds in rows:
+                    found[keys[key]] = result
+                    self.saved_tokens += tokens or 0
+                    self.saved_seconds += seconds or 0
+                if rows:
+                    self.conn.executemany('UPDATE memory SET last_used = ? WHERE key = ?', [(time.time(), row[0]) for row in rows])
+            self.conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    # tokens and seconds are the cost of producing one entry, they are added to the saved counters on every hit
+    def put_many(self, model, task, target, results, tokens=0, seconds=0):
+        now = time.time()
+        rows = [
+            (self.make_key(model, task, target, text), model, task, target, normalize_cue_text(text), result, tokens, seconds, now)
+            for text, result in results.items() if text and result
+        ]
+        if not rows:
+            return
+        with self.lock:
+            self.conn.executemany('INSERT OR REPLACE INTO memory VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            self.evict()
+            self.conn.commit()
+
+    # Least recently used entries go first once the memory is over its size
+    def evict(self):
+        count = self.conn.execute('SELECT COUNT(*) FROM memory').fetchone()[0]
+        if count > self.max_entries:
+            self.conn.execute(
+                'DELETE FROM memory WHERE key IN (SELECT key FROM memory ORDER BY last_used LIMIT ?)',
+                (count - self.max_entries,),
+            )
+
+    def stats(self):
+        with self.lock:
+            entries = self.conn.execute('SELECT COUNT(*) FROM memory').fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                'entries': entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'saved_tokens': int(self.saved_tokens),
+                'saved_seconds': round(self.saved_seconds, 1),
+            }
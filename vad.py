@@ -0,0 +1,96 @@
+# Energy based voice activity detection, the silent stretches of a shard are cut out before it is sent to Wit.ai
+# and the timestamps of the cues are mapped back to the original timeline afterwards
+
+import bisect
+import wave
+
+import numpy as np
+
+
+def frame_energy_db(wav_path, frame_seconds, chunk_seconds=60):
+    with wave.open(str(wav_path), 'rb') as wav:
+        params = wav.getparams()
+        if params.sampwidth != 2:
+            return None, params.framerate
+        frame_length = max(1, int(params.framerate * frame_seconds))
+        frames_per_chunk = frame_length * max(1, int(chunk_seconds / frame_seconds))
+        energies = []
+        while True:
+            raw = wav.readframes(frames_per_chunk)
+            if not raw:
+                break
+            samples = np.frombuffer(raw, dtype='<i2').reshape(-1, params.nchannels).mean(axis=1) / 32768.0
+            count = len(samples) // frame_length
+            if count == 0:
+                break
+            frames = samples[:count * frame_length].reshape(count, frame_length)
+            rms = np.sqrt(np.mean(frames * frames, axis=1))
+            energies.append(20 * np.log10(rms + 1e-10))
+    return (np.concatenate(energies) if energies else np.empty(0)), params.framerate
+
+
+# (start, end) frame indices of every run of True values
+def true_runs(mask):
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.astype(np.int8), [0]))))
+    return edges[0::2], edges[1::2]
+
+
+# Speech regions in seconds. A frame is speech when it is margin_db above the noise floor (a low percentile of the
+# frame energies) and above floor_db, pauses shorter than min_silence_seconds are kept inside the region around them.
+def detect_speech(wav_path, frame_seconds=0.03, margin_db=12.0, floor_db=-50.0,
+                  min_speech_seconds=0.25, min_silence_seconds=0.6, padding_seconds=0.2):
+    energy, _ = frame_energy_db(wav_path, frame_seconds)
+    if energy is None:
+        return None
+    if not len(energy):
+        return []
+    threshold = max(np.percentile(energy, 10) + margin_db, floor_db)
+    starts, ends = true_runs(energy > threshold)
+    if not len(starts):
+        return []
+
+    keep_gap = (starts[1:] - ends[:-1]) * frame_seconds >= min_silence_seconds
+    starts = starts[np.concatenate(([True], keep_gap))]
+    ends = ends[np.concatenate((keep_gap, [True]))]
+    long_enough = (ends - starts) * frame_seconds >= min_speech_seconds
+    starts, ends = starts[long_enough], ends[long_enough]
+
+    total = len(energy) * frame_seconds
+    regions = []
+    for start, end in zip(np.maximum(starts * frame_seconds - padding_seconds, 0), np.minimum(ends * frame_seconds + padding_seconds, total)):
+        if regions and start <= regions[-1][1]:
+            regions[-1] = (regions[-1][0], round(float(end), 3))
+        else:
+            regions.append((round(float(start), 3), round(float(end), 3)))
+    return regions
+
+
+# Writes the speech regions one after the other, separated by join_seconds of silence so the splitter still finds a cut
+# between them: tafrigh's splitter (auditok) only ends a segment on a silence longer than its max_silence of 0.5s.
+# Returns the segments as (shard_time, original_time, length) for to_original_time.
+def write_speech_shard(wav_path, regions, output_path, join_seconds=0.6):
+    segments = []
+    with wave.open(str(wav_path), 'rb') as wav, wave.open(str(output_path), 'wb') as out:
+        params = wav.getparams()
+        out.setparams(params)
+        silence = b'\0' * (int(params.framerate * join_seconds) * params.sampwidth * params.nchannels)
+        written = 0
+        for start, end in regions:
+            first = int(start * params.framerate)
+            wav.setpos(min(first, params.nframes))
+            frames = wav.readframes(int(end * params.framerate) - first)
+            if segments:
+                out.writeframes(silence)
+                written += len(silence) // (params.sampwidth * params.nchannels)
+            length = len(frames) // (params.sampwidth * params.nchannels)
+            segments.append((written / params.framerate, first / params.framerate, length / params.framerate))
+            out.writeframes(frames)
+            written += length
+    return segments
+
+
+def to_original_time(segments, seconds):
+    position = max(0, bisect.bisect_right([shard_time for shard_time, _, _ in segments], seconds) - 1)
+    shard_time, original_time, length = segments[position]
+    # A time inside the silence added between two regions belongs to the end of the region before it
+    return original_time + min(max(seconds - shard_time, 0), length)
@@ -0,0 +1,114 @@
+# Resident faster-whisper model for the local transcription backend. The CTranslate2 model is loaded once per process
+# and shared by every job: the jobs run on WHISPER_WORKERS threads, each a parallel worker of the same model
+# (num_workers), and the speech segments of a file are decoded in batches of WHISPER_BATCH_SIZE when the installed
+# faster-whisper has the batched pipeline. Needs faster-whisper (pip install faster-whisper), it is only imported on load.
+
+import importlib.util
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+WHISPER_MODEL = os.getenv('WHISPER_MODEL', 'small')
+WHISPER_DEVICE = os.getenv('WHISPER_DEVICE', 'cpu')
+# int8 is the fastest on CPU, float16 or int8_float16 on GPU
+WHISPER_COMPUTE_TYPE = os.getenv('WHISPER_COMPUTE_TYPE', 'int8')
+# Threads of one worker, 0 lets CTranslate2 decide. Workers x threads should not be more than the cores.
+WHISPER_CPU_THREADS = int(os.getenv('WHISPER_CPU_THREADS', '0'))
+WHISPER_WORKERS = int(os.getenv('WHISPER_WORKERS', '2'))
+WHISPER_BATCH_SIZE = int(os.getenv('WHISPER_BATCH_SIZE', '8'))
+WHISPER_BEAM_SIZE = int(os.getenv('WHISPER_BEAM_SIZE', '5'))
+
+
+def whisper_installed():
+    return importlib.util.find_spec('faster_whisper') is not None
+
+
+class WhisperService:
+    def __init__(self, model_name=WHISPER_MODEL, device=WHISPER_DEVICE, compute_type=WHISPER_COMPUTE_TYPE,
+                 cpu_threads=WHISPER_CPU_THREADS, workers=WHISPER_WORKERS, batch_size=WHISPER_BATCH_SIZE,
+                 beam_size=WHISPER_BEAM_SIZE):
+        self.model_name = model_name
+        self.device = device
+        self.compute_type = compute_type
+        self.cpu_threads = cpu_threads
+        self.workers = workers
+        self.batch_size = batch_size
+        self.beam_size = beam_size
+        self.model = None
+        self.pipeline = None
+        self.load_lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='whisper')
+        self.load_seconds = 0.0
+        self.queued = 0
+        self.running = 0
+        self.jobs = 0
+        self.audio_seconds = 0.0
+        self.busy_seconds = 0.0
+
+    # Called at startup so the first job does not wait for the model, later calls return the loaded model
+    def load(self):
+        with self.load_lock:
+            if self.model is None:
+                import faster_whisper
+
+                started = time.monotonic()
+                self.model = faster_whisper.WhisperModel(self.model_name, device=self.device, compute_type=self.compute_type,
+                                                         cpu_threads=self.cpu_threads, num_workers=self.workers)
+                if self.batch_size > 1 and hasattr(faster_whisper, 'BatchedInferencePipeline'):
+                    self.pipeline = faster_whisper.BatchedInferencePipeline(model=self.model)
+                self.load_seconds = time.monotonic() - started
+                print(f"Loaded whisper model {self.model_name} ({self.compute_type} on {self.device}) in {self.load_seconds:.1f}s")
+        return self.model
+
+    def run(self, audio_path, language, task, on_progress):
+        with self.stats_lock:
+            self.queued -= 1
+            self.running += 1
+        started = time.monotonic()
+        try:
+            self.load()
+            options = dict(language=language or None, task=task or 'transcribe', beam_size=self.beam_size)
+            if self.pipeline:
+                segments, info = self.pipeline.transcribe(str(audio_path), batch_size=self.batch_size, **options)
+            else:
+                segments, info = self.model.transcribe(str(audio_path), vad_filter=True, **options)
+            # The segments are decoded lazily, while iterating
+            result = []
+            for segment in segments:
+                result.append({'text': segment.text.strip(), 'start': segment.start, 'end': segment.end})
+                if on_progress and info.duration:
+                    on_progress(min(1.0, segment.end / info.duration))
+            with self.stats_lock:
+                self.jobs += 1
+                self.audio_seconds += info.duration
+            return result
+        finally:
+            with self.stats_lock:
+                self.running -= 1
+                self.busy_seconds += time.monotonic() - started
+
+    # Segments ({'text', 'start', 'end'}, as tafrigh gives them) of the audio file, waits for a free worker.
+    # on_progress(fraction) is called from the worker thread as the segments are decoded.
+    def transcribe(self, audio_path, language=None, task='transcribe', on_progress=None):
+        with self.stats_lock:
+            self.queued += 1
+        return self.executor.submit(self.run, audio_path, language, task, on_progress).result()
+
+    def stats(self):
+        with self.stats_lock:
+            return {
+                'model': self.model_name,
+                'compute_type': self.compute_type,
+                'loaded': self.model is not None,
+                'load_seconds': round(self.load_seconds, 2),
+                'batched': self.pipeline is not None,
+                'workers': self.workers,
+                'queued': self.queued,
+                'running': self.running,
+                'jobs': self.jobs,
+                'audio_seconds': round(self.audio_seconds, 1),
+                # Seconds of audio transcribed per second of worker time
+                'speed': round(self.audio_seconds / self.busy_seconds, 2) if self.busy_seconds else None,
+            }